@@ -0,0 +1,72 @@
+import json
+import logging
+from typing import Dict, List, Tuple, Union
+from app.ai.generator import build_completion_request, parse_post_text
+from app.ai.openai_client import client
+from app.metrics import record_llm_usage
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+# Статусы, после которых батч больше не меняется
+FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def build_batch_file(news: List[Tuple[str, str]]) -> bytes:
+    """JSONL для Batch API: одна строка-запрос на новость, custom_id — id новости"""
+    lines = [
+        json.dumps({
+            "custom_id": news_id,
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": build_completion_request(summary),
+        }, ensure_ascii=False)
+        for news_id, summary in news
+    ]
+    return "\n".join(lines).encode("utf-8")
+
+
+async def submit_batch(news: List[Tuple[str, str]]):
+    """Загружает JSONL и создаёт батч. Возвращает объект Batch"""
+    batch_file = await client.files.create(
+        file=("posts.jsonl", build_batch_file(news), "application/jsonl"),
+        purpose="batch"
+    )
+    return await client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window="24h",
+    )
+
+
+async def retrieve_batch(batch_id: str):
+    return await client.batches.retrieve(batch_id)
+
+
+async def download_batch_results(batch) -> Dict[str, Union[dict, str]]:
+    """
+    Читает выходной файл батча.
+    Возвращает {custom_id: {'title', 'content'}} для успешных запросов
+    и {custom_id: текст ошибки} для неудачных.
+    """
+    results = {}
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        content = await client.files.content(file_id)
+        for line in content.text.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            custom_id = record["custom_id"]
+            response = record.get("response") or {}
+            if response.get("status_code") == 200:
+                try:
+                    message = response["body"]["choices"][0]["message"]["content"]
+                    record_llm_usage(response["body"].get("usage"))
+                    results[custom_id] = parse_post_text(message)
+                except (KeyError, IndexError, TypeError) as e:
+                    results[custom_id] = f"malformed response: {e}"
+            else:
+                results[custom_id] = str(record.get("error") or response.get("body"))
+    return results
@@ -0,0 +1,208 @@
+import hashlib
+import json
+from abc import ABC, abstractmethod
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(summary: str, model: str, prompt_version: str, temperature: float) -> str:
+    """Ключ по содержимому: нормализованный текст новости + параметры генерации"""
+    normalized = " ".join(summary.split())
+    payload = json.dumps([normalized, model, prompt_version, temperature], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache(ABC):
+    """
+    Кэш ответов LLM с TTL и вытеснением давно не использованных записей.
+    TTL отсчитывается от последнего обращения: попадание продлевает запись.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: dict):
+        ...
+
+    @abstractmethod
+    def stats(self) -> dict:
+        ...
+
+
+class NullLLMCache(LLMCache):
+    def get(self, key: str) -> Optional[dict]:
+        return None
+
+    def set(self, key: str, value: dict):
+        pass
+
+    def stats(self) -> dict:
+        return {"backend": "none", "hits": 0, "misses": 0, "size": 0}
+
+
+class RedisLLMCache(LLMCache):
+    """
+    Записи живут LLM_CACHE_TTL секунд (SET EX, попадание продлевает через GETEX),
+    время последнего доступа хранится в ZSET. Раз срок записи всегда равен этому времени + TTL,
+    истёкшие члены ZSET удаляются по score до подсчёта размера; при превышении
+    LLM_CACHE_MAX_ENTRIES вытесняются самые старые по доступу живые записи.
+    Счётчики попаданий общие для всех процессов.
+    """
+
+    PREFIX = "llm_cache"
+
+    def __init__(self, url: str, ttl: int, max_entries: int):
+        import redis
+
+        self.redis = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lru_key = f"{self.PREFIX}:lru"
+
+    def _key(self, key: str) -> str:
+        return f"{self.PREFIX}:item:{key}"
+
+    def _prune_expired(self, pipe, now: float):
+        """Убирает из ZSET ключи, которые Redis уже удалил по TTL"""
+        if self.ttl:
+            pipe.zremrangebyscore(self.lru_key, "-inf", now - self.ttl)
+
+    def get(self, key: str) -> Optional[dict]:
+        now = time.time()
+        raw = self.redis.getex(self._key(key), ex=self.ttl) if self.ttl else self.redis.get(self._key(key))
+        pipe = self.redis.pipeline()
+        if raw is None:
+            pipe.incr(f"{self.PREFIX}:misses")
+            pipe.zrem(self.lru_key, key)
+        else:
+            pipe.incr(f"{self.PREFIX}:hits")
+            pipe.zadd(self.lru_key, {key: now})
+        pipe.execute()
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: dict):
+        now = time.time()
+        pipe = self.redis.pipeline()
+        pipe.set(self._key(key), json.dumps(value, ensure_ascii=False), ex=self.ttl or None)
+        pipe.zadd(self.lru_key, {key: now})
+        self._prune_expired(pipe, now)
+        pipe.zcard(self.lru_key)
+        size = pipe.execute()[-1]
+        if self.max_entries and size > self.max_entries:
+            evicted = [k.decode() for k, _ in self.redis.zpopmin(self.lru_key, size - self.max_entries)]
+            if evicted:
+                self.redis.delete(*(self._key(k) for k in evicted))
+
+    def stats(self) -> dict:
+        pipe = self.redis.pipeline()
+        pipe.mget(f"{self.PREFIX}:hits", f"{self.PREFIX}:misses")
+        self._prune_expired(pipe, time.time())
+        pipe.zcard(self.lru_key)
+        results = pipe.execute()
+        hits, misses = results[0]
+        return {
+            "backend": "redis",
+            "hits": int(hits or 0),
+            "misses": int(misses or 0),
+            "size": results[-1],
+        }
+
+
+class SQLiteLLMCache(LLMCache):
+    """Локальный кэш в файле SQLite, соединение открывается заново после fork"""
+
+    def __init__(self, path: str, ttl: int, max_entries: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_accessed_at ON llm_cache (accessed_at)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS llm_cache_stats (name TEXT PRIMARY KEY, value INTEGER)")
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, key: str) -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT value FROM llm_cache WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, now)
+            ).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE llm_cache SET accessed_at = ?, expires_at = ? WHERE key = ?",
+                    (now, now + self.ttl if self.ttl else None, key)
+                )
+            conn.execute(
+                "INSERT INTO llm_cache_stats VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1",
+                ("hits" if row else "misses",)
+            )
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: dict):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now + self.ttl if self.ttl else None, now)
+            )
+            conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+            if self.max_entries:
+                conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN ("
+                    "SELECT key FROM llm_cache ORDER BY accessed_at "
+                    "LIMIT max(0, (SELECT COUNT(*) FROM llm_cache) - ?))",
+                    (self.max_entries,)
+                )
+
+    def stats(self) -> dict:
+        with self._lock:
+            conn = self._connection()
+            counters = dict(conn.execute("SELECT name, value FROM llm_cache_stats").fetchall())
+            size = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "size": size,
+        }
+
+
+_cache: Optional[LLMCache] = None
+
+
+def get_llm_cache() -> LLMCache:
+    """Кэш, выбранный в LLM_CACHE_BACKEND: redis, sqlite или none"""
+    global _cache
+    if _cache is None:
+        backend = settings.LLM_CACHE_BACKEND
+        if backend == "redis":
+            _cache = RedisLLMCache(settings.LLM_CACHE_REDIS_URL, settings.LLM_CACHE_TTL, settings.LLM_CACHE_MAX_ENTRIES)
+        elif backend == "sqlite":
+            _cache = SQLiteLLMCache(settings.LLM_CACHE_SQLITE_PATH, settings.LLM_CACHE_TTL, settings.LLM_CACHE_MAX_ENTRIES)
+        else:
+            _cache = NullLLMCache()
+    return _cache
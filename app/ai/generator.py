@@ -1,54 +1,307 @@
+import asyncio
+import json
 import logging
+import time
+from typing import AsyncIterator, Dict, List, Tuple, Union
+from app.ai.cache import get_llm_cache, make_cache_key
 from app.ai.openai_client import client
+from app.ai.rate_limit import RateLimiter, estimate_tokens
 from app.config import settings
+from app.metrics import LLM_CACHE_LOOKUPS, LLM_REQUEST_SECONDS, record_llm_usage
 
 logger = logging.getLogger(__name__)
 
+# Меняется при любой правке промпта, чтобы не отдавать из кэша ответы на старый
+PROMPT_VERSION = "1"
+POST_RULES = (
+    "Ты редактор популярного IT-канала в Telegram. "
+    "Твоя задача — написать короткий, цепляющий пост (до 500 символов) на основе новости. "
+    "Пост не должен отправлять на сторонние ресурсы. "
+    "Пост должен быть конечным и не подразумевать продолжения в какой-то статье. "
+    "Используй эмодзи, хештеги и дружелюбный тон. "
+    "Не упоминай источник новости. "
+)
+SYSTEM_PROMPT = POST_RULES + "Формат: сначала заголовок (1 строка), затем пустая строка, затем текст поста."
+# Несколько новостей в одном запросе: правила те же, ответ — JSON по POSTS_SCHEMA
+MULTI_SYSTEM_PROMPT = POST_RULES + (
+    "Тебе дают несколько новостей — JSON-массив объектов {news_id, text}. "
+    "Для каждой новости напиши отдельный пост: не объединяй новости и не пропускай ни одной. "
+    "В ответе для каждой новости: news_id — как во входных данных, title — заголовок поста в одну строку, "
+    "content — текст поста."
+)
+POSTS_SCHEMA = {
+    "name": "posts",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "posts": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "news_id": {"type": "string"},
+                        "title": {"type": "string"},
+                        "content": {"type": "string"},
+                    },
+                    "required": ["news_id", "title", "content"],
+                    "additionalProperties": False,
+                },
+            },
+        },
+        "required": ["posts"],
+        "additionalProperties": False,
+    },
+}
+TEMPERATURE = 0.7
+MAX_TOKENS = 500
+# Пост публикуется одним сообщением Telegram
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+
+class InvalidPostError(ValueError):
+    """Модель не вернула для новости пригодный пост"""
+
+
+def build_completion_request(news_summary: str) -> dict:
+    """Параметры chat completion для одной новости (общие для онлайн- и batch-режима)"""
+    return {
+        "model": settings.OPENAI_MODEL,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": f"Новость: {news_summary}"}
+        ],
+        "temperature": TEMPERATURE,
+        "max_tokens": MAX_TOKENS,
+    }
+
+
+def build_multi_completion_request(items: List[Tuple[str, str]]) -> dict:
+    """Один chat completion на несколько новостей; items — [(news_id, текст новости)]"""
+    news = json.dumps([{"news_id": news_id, "text": text} for news_id, text in items], ensure_ascii=False)
+    return {
+        "model": settings.OPENAI_MODEL,
+        "messages": [
+            {"role": "system", "content": MULTI_SYSTEM_PROMPT},
+            {"role": "user", "content": news}
+        ],
+        "temperature": TEMPERATURE,
+        "max_tokens": MAX_TOKENS * len(items),
+        "response_format": {"type": "json_schema", "json_schema": POSTS_SCHEMA},
+    }
 
-async def generate_post_from_news(news_summary: str) -> dict:
+
+def _validate_post(entry: dict) -> Union[dict, InvalidPostError]:
+    title, content = entry.get("title"), entry.get("content")
+    if not isinstance(title, str) or not isinstance(content, str) or not title.strip() or not content.strip():
+        return InvalidPostError("empty title or content")
+    title, content = " ".join(title.split()), content.strip()
+    if len(title) + len(content) + 2 > TELEGRAM_MESSAGE_LIMIT:
+        return InvalidPostError("post does not fit into a Telegram message")
+    return {"title": title, "content": content}
+
+
+def parse_multi_post_response(raw_text: str, news_ids: List[str]) -> Dict[str, Union[dict, InvalidPostError]]:
+    """
+    Разбирает JSON-ответ на пачку новостей, проверяя каждую запись отдельно.
+    Возвращает {news_id: {'title', 'content'} или InvalidPostError} для каждого id из news_ids.
+    """
+    try:
+        entries = json.loads(raw_text)["posts"]
+        if not isinstance(entries, list):
+            raise TypeError("posts is not a list")
+    except (ValueError, KeyError, TypeError) as e:
+        error = InvalidPostError(f"malformed response: {e}")
+        return {news_id: error for news_id in news_ids}
+
+    results = {}
+    for entry in entries:
+        # Записи с чужим или повторным news_id пропускаем
+        if isinstance(entry, dict) and entry.get("news_id") in news_ids and entry["news_id"] not in results:
+            results[entry["news_id"]] = _validate_post(entry)
+    for news_id in news_ids:
+        results.setdefault(news_id, InvalidPostError("no post for this news in response"))
+    return results
+
+
+def parse_post_text(raw_text: str) -> dict:
+    """Делит ответ модели на заголовок и текст поста"""
+    raw_text = raw_text.strip()
+
+    # Разделяем на заголовок и контент
+    parts = raw_text.split('\n\n', 1)
+    if len(parts) == 2:
+        title, content = parts
+    else:
+        # Если нет пустой строки — первая строка как заголовок
+        lines = raw_text.split('\n', 1)
+        title = lines[0]
+        content = lines[1] if len(lines) > 1 else raw_text
+
+    return {
+        "title": title.strip(),
+        "content": content.strip()
+    }
+
+
+def news_cache_key(news_summary: str, multi: bool = False) -> str:
+    """Ключ кэша поста; ответы на SYSTEM_PROMPT и MULTI_SYSTEM_PROMPT хранятся раздельно"""
+    prompt_version = f"{PROMPT_VERSION}-multi" if multi else PROMPT_VERSION
+    return make_cache_key(news_summary, settings.OPENAI_MODEL, prompt_version, TEMPERATURE)
+
+
+async def generate_post_from_news(news_summary: str, rate_limiter: RateLimiter = None) -> dict:
     """
     Генерирует пост для Telegram на основе краткого содержания новости.
     Возвращает {'title': str, 'content': str}
     """
+    cache_key = news_cache_key(news_summary)
+    cached = cache_get(cache_key)
+    LLM_CACHE_LOOKUPS.labels("hit" if cached else "miss").inc()
+    if cached:
+        return cached
+
     try:
-        response = await client.chat.completions.create(
-            model=settings.OPENAI_MODEL,
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "Ты редактор популярного IT-канала в Telegram. "
-                        "Твоя задача — написать короткий, цепляющий пост (до 500 символов) на основе новости. "
-                        "Пост не должен отправлять на сторонние ресурсы. "
-                        "Пост должен быть конечным и не подразумевать продолжения в какой-то статье. "
-                        "Используй эмодзи, хештеги и дружелюбный тон. "
-                        "Не упоминай источник новости. "
-                        "Формат: сначала заголовок (1 строка), затем пустая строка, затем текст поста."
-                    )
-                },
-                {"role": "user", "content": f"Новость: {news_summary}"}
-            ],
-            temperature=0.7,
-            max_tokens=500,
-        )
-
-        raw_text = response.choices[0].message.content.strip()
-
-        # Разделяем на заголовок и контент
-        parts = raw_text.split('\n\n', 1)
-        if len(parts) == 2:
-            title, content = parts
-        else:
-            # Если нет пустой строки — первая строка как заголовок
-            lines = raw_text.split('\n', 1)
-            title = lines[0]
-            content = lines[1] if len(lines) > 1 else raw_text
+        if rate_limiter:
+            # OpenAI учитывает max_tokens в лимите TPM, поэтому резервируем их сразу
+            await rate_limiter.acquire(estimate_tokens(SYSTEM_PROMPT + news_summary) + MAX_TOKENS)
 
-        return {
-            "title": title.strip(),
-            "content": content.strip()
-        }
+        # Ожидание в rate limiter в задержку запроса не входит
+        started = time.perf_counter()
+        try:
+            response = await client.chat.completions.create(**build_completion_request(news_summary))
+        except Exception:
+            LLM_REQUEST_SECONDS.labels("error").observe(time.perf_counter() - started)
+            raise
+        LLM_REQUEST_SECONDS.labels("ok").observe(time.perf_counter() - started)
+        record_llm_usage(response.usage)
+        result = parse_post_text(response.choices[0].message.content)
 
     except Exception as e:
         logger.error(f"Ошибка генерации поста: {e}")
         raise
+
+    cache_set(cache_key, result)
+    return result
+
+
+async def generate_posts_for_news_group(
+        summaries: List[str], rate_limiter: RateLimiter = None
+) -> List[Union[dict, Exception]]:
+    """
+    Генерирует посты для нескольких новостей одним запросом со структурированным JSON-ответом.
+    Новости, для которых пост не прошёл проверку, повторяются отдельным запросом только для них
+    (до GENERATION_ENTRY_RETRIES раз). Ошибка самого запроса не повторяется: клиент OpenAI
+    уже сделал свои попытки, а новости вернутся в очередь.
+    Возвращает пост или исключение для каждой новости в том же порядке.
+    """
+    results: List[Union[dict, Exception, None]] = [None] * len(summaries)
+    pending = []
+    for index, summary in enumerate(summaries):
+        cached = cache_get(news_cache_key(summary, multi=True))
+        LLM_CACHE_LOOKUPS.labels("hit" if cached else "miss").inc()
+        if cached:
+            results[index] = cached
+        else:
+            pending.append(index)
+
+    for attempt in range(settings.GENERATION_ENTRY_RETRIES + 1):
+        if not pending:
+            break
+        # Короткие номера вместо UUID экономят токены
+        items = [(str(number), summaries[index]) for number, index in enumerate(pending, 1)]
+        try:
+            parsed = await _request_posts(items, rate_limiter)
+        except Exception as e:
+            logger.error(f"Ошибка генерации постов для {len(pending)} новостей: {e}")
+            for index in pending:
+                results[index] = e
+            break
+
+        failed = []
+        for (news_id, _), index in zip(items, pending):
+            results[index] = parsed[news_id]
+            if isinstance(parsed[news_id], Exception):
+                failed.append(index)
+            else:
+                cache_set(news_cache_key(summaries[index], multi=True), parsed[news_id])
+        if failed:
+            logger.warning(f"{len(failed)} из {len(pending)} постов не прошли проверку (попытка {attempt + 1})")
+        pending = failed
+
+    return results
+
+
+async def _request_posts(items: List[Tuple[str, str]], rate_limiter: RateLimiter = None) -> Dict:
+    request = build_multi_completion_request(items)
+    if rate_limiter:
+        prompt = "".join(message["content"] for message in request["messages"])
+        await rate_limiter.acquire(estimate_tokens(prompt) + request["max_tokens"])
+
+    started = time.perf_counter()
+    try:
+        response = await client.chat.completions.create(**request)
+    except Exception:
+        LLM_REQUEST_SECONDS.labels("error").observe(time.perf_counter() - started)
+        raise
+    LLM_REQUEST_SECONDS.labels("ok").observe(time.perf_counter() - started)
+    record_llm_usage(response.usage)
+    return parse_multi_post_response(response.choices[0].message.content or "", [news_id for news_id, _ in items])
+
+
+def cache_get(key: str):
+    # Недоступный кэш не должен останавливать генерацию
+    try:
+        return get_llm_cache().get(key)
+    except Exception as e:
+        logger.warning(f"LLM cache read failed: {e}")
+        return None
+
+
+def cache_set(key: str, value: dict):
+    try:
+        get_llm_cache().set(key, value)
+    except Exception as e:
+        logger.warning(f"LLM cache write failed: {e}")
+
+
+async def generate_posts_concurrently(
+        summaries: List[str], semaphore: asyncio.Semaphore = None, rate_limiter: RateLimiter = None
+) -> AsyncIterator[Tuple[int, Union[dict, Exception]]]:
+    """
+    Генерирует посты параллельно: не больше LLM_CONCURRENCY запросов одновременно
+    и в пределах LLM_REQUESTS_PER_MINUTE / LLM_TOKENS_PER_MINUTE.
+    Чтобы лимиты действовали между вызовами, semaphore и rate_limiter передаются общие
+    на процесс; без них создаются новые только на этот вызов.
+    При GENERATION_ITEMS_PER_REQUEST > 1 новости уходят в LLM группами по столько штук.
+    Отдаёт (индекс, результат или исключение) по мере готовности.
+    """
+    semaphore = semaphore or asyncio.Semaphore(max(1, settings.LLM_CONCURRENCY))
+    rate_limiter = rate_limiter or RateLimiter(settings.LLM_REQUESTS_PER_MINUTE, settings.LLM_TOKENS_PER_MINUTE)
+    group_size = max(1, settings.GENERATION_ITEMS_PER_REQUEST)
+
+    async def generate(index: int, summary: str):
+        async with semaphore:
+            try:
+                return [(index, await generate_post_from_news(summary, rate_limiter))]
+            except Exception as e:
+                return [(index, e)]
+
+    async def generate_group(indices: range):
+        async with semaphore:
+            try:
+                results = await generate_posts_for_news_group([summaries[i] for i in indices], rate_limiter)
+            except Exception as e:
+                results = [e] * len(indices)
+            return list(zip(indices, results))
+
+    if group_size == 1:
+        tasks = [generate(i, s) for i, s in enumerate(summaries)]
+    else:
+        tasks = [
+            generate_group(range(start, min(start + group_size, len(summaries))))
+            for start in range(0, len(summaries), group_size)
+        ]
+    for future in asyncio.as_completed(tasks):
+        for result in await future:
+            yield result
@@ -11,7 +11,8 @@ if proxy_url:
     transport = AsyncHTTPTransport(proxy=proxy_url)
     client = AsyncOpenAI(
         api_key=settings.OPENAI_API_KEY,
+        base_url=settings.OPENAI_BASE_URL or None,
         http_client=httpx.AsyncClient(transport=transport, timeout=60.0)
     )
 else:
-    client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+    client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL or None)
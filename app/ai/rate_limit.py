@@ -0,0 +1,48 @@
+import asyncio
+import time
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка числа токенов: для смеси кириллицы и латиницы ~3 символа на токен"""
+    return len(text) // 3 + 1
+
+
+class TokenBucket:
+    """Асинхронное ведро токенов: rate_per_minute единиц в минуту, не больше capacity за раз"""
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1):
+        if self.rate <= 0:
+            return
+        # Запрос больше ёмкости иначе ждал бы вечно
+        amount = min(amount, self.capacity)
+        # Ожидающие обслуживаются по очереди, пока держат блокировку
+        async with self._lock:
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+
+
+class RateLimiter:
+    """Лимит запросов и токенов в минуту для LLM API (RPM/TPM)"""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    async def acquire(self, tokens: int):
+        await self.requests.acquire(1)
+        await self.tokens.acquire(tokens)
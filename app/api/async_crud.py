@@ -0,0 +1,287 @@
+"""
+Асинхронные версии функций crud для эндпоинтов FastAPI.
+Логика и счётчики те же, что в app.api.crud; Celery-задачи пользуются синхронным модулем.
+"""
+from sqlalchemy import Double, cast, select, update, func, literal_column
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.api.crud import (
+    counters_increment_statement, counters_lock_statements, counters_replace_statement,
+    near_duplicate_successor_query, news_stats_from_counters, posts_stats_from_counters,
+    repoint_near_duplicates_statements, stat_counter_names, _status_counter
+)
+from app.api.pagination import encode_cursor, keyset_query, split_page
+from app.models import NewsItem, Post, NewsSource, StatCounter
+from app.api.schemas import NewsItemCreate, NewsItemUpdate, PostCreate, PostUpdate, PostStatus, NewsSourceCreate, \
+    NewsSourceUpdate
+import uuid
+
+
+async def _keyset_page(db: AsyncSession, stmt, sort_column, id_column, cursor: str, limit: int):
+    rows = (await db.scalars(keyset_query(stmt, sort_column, id_column, cursor, limit))).all()
+    return split_page(list(rows), sort_column, id_column, limit)
+
+
+async def get_news_item(db: AsyncSession, news_id: uuid.UUID):
+    return await db.get(NewsItem, news_id)
+
+
+async def get_news_items(db: AsyncSession, cursor: str = None, limit: int = 100):
+    """Новости от новых к старым; возвращает (новости, курсор следующей страницы)"""
+    return await _keyset_page(db, select(NewsItem), NewsItem.published_at, NewsItem.id, cursor, limit)
+
+
+# Та же конфигурация, что в выражении NewsItem.search_vector
+NEWS_SEARCH_CONFIG = literal_column("'russian'::regconfig")
+
+
+async def search_news_items(db: AsyncSession, q: str, sort: str = "rank", cursor: str = None, limit: int = 20):
+    """
+    Полнотекстовый поиск по заголовку и тексту новостей (синтаксис websearch: "фраза", -исключить, or).
+    sort=rank — по релевантности, sort=date — от новых к старым; страницы по ключу (сортировка, id).
+    Возвращает ([(новость, ранг)], курсор следующей страницы).
+    """
+    query = func.websearch_to_tsquery(NEWS_SEARCH_CONFIG, q)
+    # ts_rank_cd возвращает real; в double он переводится точно, и ранг из курсора совпадает с рангом в БД
+    rank = cast(func.ts_rank_cd(NewsItem.search_vector, query), Double)
+    stmt = select(NewsItem, rank.label("rank")).where(NewsItem.search_vector.op("@@")(query))
+    if sort == "rank":
+        stmt = keyset_query(stmt, rank, NewsItem.id, cursor, limit, sort_type=float)
+    else:
+        stmt = keyset_query(stmt, NewsItem.published_at, NewsItem.id, cursor, limit)
+
+    rows = (await db.execute(stmt)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        news, last_rank = rows[-1]
+        next_cursor = encode_cursor(last_rank if sort == "rank" else news.published_at, news.id)
+    return [(news, news_rank) for news, news_rank in rows], next_cursor
+
+
+class DuplicateNewsError(ValueError):
+    """Новость с таким URL уже есть"""
+
+
+async def create_news_item(db: AsyncSession, news: NewsItemCreate):
+    data = news.model_dump()
+    # Как и при массовой вставке: пустой URL не участвует в уникальном индексе
+    data["url"] = data["url"] or None
+    db_news = NewsItem(**data)
+    db.add(db_news)
+    await bump_counters(db, news_total=1)
+    await _commit_news(db)
+    await db.refresh(db_news)
+    return db_news
+
+
+async def update_news_item(db: AsyncSession, news_id: uuid.UUID, news_update: NewsItemUpdate):
+    db_news = await get_news_item(db, news_id)
+    if not db_news:
+        return None
+    for key, value in news_update.model_dump(exclude_unset=True).items():
+        if key == "url" and value == "":
+            db_news.url = None
+        elif value is not None:
+            setattr(db_news, key, value)
+    await _commit_news(db)
+    await db.refresh(db_news)
+    return db_news
+
+
+async def _commit_news(db: AsyncSession):
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise DuplicateNewsError("News item with this URL already exists")
+
+
+async def delete_news_item(db: AsyncSession, news_id: uuid.UUID):
+    db_news = await get_news_item(db, news_id)
+    if not db_news:
+        return False
+    successor_id = await db.scalar(near_duplicate_successor_query(news_id))
+    if successor_id is not None:
+        for stmt in repoint_near_duplicates_statements(news_id, successor_id):
+            await db.execute(stmt)
+    await db.delete(db_news)
+    await bump_counters(db, news_total=-1)
+    await db.commit()
+    return True
+
+
+async def get_post(db: AsyncSession, post_id: uuid.UUID):
+    return await db.get(Post, post_id)
+
+
+async def get_posts(db: AsyncSession, cursor: str = None, limit: int = 100):
+    """Посты от новых к старым; возвращает (посты, курсор следующей страницы)"""
+    return await _keyset_page(db, select(Post), Post.created_at, Post.id, cursor, limit)
+
+
+async def get_posts_by_status(db: AsyncSession, status: PostStatus, cursor: str = None, limit: int = 100):
+    stmt = select(Post).where(Post.status == status)
+    return await _keyset_page(db, stmt, Post.created_at, Post.id, cursor, limit)
+
+
+async def create_post(db: AsyncSession, post: PostCreate):
+    # Проверяем, существует ли news_item
+    news_item = await db.get(NewsItem, post.news_item_id)
+    if not news_item:
+        raise ValueError(f"NewsItem with id {post.news_item_id} not found")
+
+    has_posts = await db.scalar(select(Post.id).where(Post.news_item_id == post.news_item_id).limit(1)) is not None
+    db_post = Post(**post.model_dump())
+    db.add(db_post)
+    await bump_counters(db, **{_status_counter(db_post.status): 1, "news_processed": 0 if has_posts else 1})
+    await _set_generation_status(db, [post.news_item_id], "done")
+    try:
+        await db.commit()
+        await db.refresh(db_post)
+    except IntegrityError:
+        await db.rollback()
+        raise ValueError("Invalid news_item_id")
+    return db_post
+
+
+async def update_post(db: AsyncSession, post_id: uuid.UUID, post_update: PostUpdate):
+    db_post = await get_post(db, post_id)
+    if not db_post:
+        return None
+    old_status = db_post.status
+    for key, value in post_update.model_dump(exclude_unset=True).items():
+        if value is not None:
+            setattr(db_post, key, value)
+    if db_post.status != old_status:
+        await bump_counters(db, **{_status_counter(old_status): -1, _status_counter(db_post.status): 1})
+    await db.commit()
+    await db.refresh(db_post)
+    return db_post
+
+
+async def delete_post(db: AsyncSession, post_id: uuid.UUID):
+    db_post = await get_post(db, post_id)
+    if not db_post:
+        return False
+    other_posts = await db.scalar(
+        select(Post.id).where(Post.news_item_id == db_post.news_item_id, Post.id != db_post.id).limit(1)
+    )
+    await db.delete(db_post)
+    await bump_counters(db, **{_status_counter(db_post.status): -1, "news_processed": 0 if other_posts else -1})
+    if not other_posts:
+        # Как и раньше, новость без постов снова попадает в генерацию
+        await _set_generation_status(db, [db_post.news_item_id], "pending")
+    await db.commit()
+    return True
+
+
+async def retry_failed_posts(db: AsyncSession):
+    """Возвращает список ID постов со статусом 'failed'"""
+    post_ids = list(await db.scalars(
+        update(Post)
+        .where(Post.status == PostStatus.failed)
+        .values(status=PostStatus.draft)
+        .returning(Post.id)
+        .execution_options(synchronize_session=False)
+    ))
+    await bump_counters(db, posts_failed=-len(post_ids), posts_draft=len(post_ids))
+    await db.commit()
+    return post_ids
+
+
+async def _set_generation_status(db: AsyncSession, news_ids, status: str):
+    await db.execute(
+        update(NewsItem)
+        .where(NewsItem.id.in_(list(news_ids)))
+        .values(generation_status=status)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def bump_counters(db: AsyncSession, **deltas: int):
+    """Прибавляет значения к счётчикам дашборда в текущей транзакции"""
+    stmt = counters_increment_statement(deltas)
+    if stmt is not None:
+        await db.execute(stmt)
+
+
+async def rebuild_stat_counters(db: AsyncSession) -> dict:
+    """Пересчитывает счётчики по таблицам"""
+    for stmt in counters_lock_statements(stat_counter_names()):
+        await db.execute(stmt)
+    counters = {_status_counter(status): 0 for status in PostStatus}
+    rows = await db.execute(select(Post.status, func.count(Post.id)).group_by(Post.status))
+    counters.update({_status_counter(status): count for status, count in rows})
+    counters["news_total"] = await db.scalar(select(func.count(NewsItem.id)))
+    counters["news_processed"] = await db.scalar(select(func.count(func.distinct(Post.news_item_id))))
+    counters["initialized"] = 1
+
+    await db.execute(counters_replace_statement(counters))
+    await db.commit()
+    return counters
+
+
+async def get_stat_counters(db: AsyncSession) -> dict:
+    counters = dict((await db.execute(select(StatCounter.name, StatCounter.value))).all())
+    if "initialized" not in counters:
+        counters = await rebuild_stat_counters(db)
+    return counters
+
+
+async def get_news_stats(db: AsyncSession, counters: dict = None):
+    return news_stats_from_counters(counters or await get_stat_counters(db))
+
+
+async def get_posts_stats(db: AsyncSession, counters: dict = None):
+    return posts_stats_from_counters(counters or await get_stat_counters(db))
+
+
+async def get_news_source(db: AsyncSession, source_id: int):
+    return await db.get(NewsSource, source_id)
+
+
+async def get_news_sources(db: AsyncSession, skip: int = 0, limit: int = 100):
+    return (await db.scalars(select(NewsSource).offset(skip).limit(limit))).all()
+
+
+async def create_news_source(db: AsyncSession, source: NewsSourceCreate):
+    db_source = NewsSource(**source.model_dump())
+    db.add(db_source)
+    await db.commit()
+    await db.refresh(db_source)
+    return db_source
+
+
+async def update_news_source(db: AsyncSession, source_id: int, source_update: NewsSourceUpdate):
+    db_source = await get_news_source(db, source_id)
+    if not db_source:
+        return None
+    if source_update.url is not None and source_update.url != db_source.url:
+        # Валидаторы старого адреса к новой ленте не относятся
+        db_source.etag = db_source.last_modified = db_source.content_hash = None
+    for key, value in source_update.model_dump(exclude_unset=True).items():
+        if value is not None:
+            setattr(db_source, key, value)
+    await db.commit()
+    await db.refresh(db_source)
+    return db_source
+
+
+async def delete_news_source(db: AsyncSession, source_id: int):
+    db_source = await get_news_source(db, source_id)
+    if not db_source:
+        return False
+    await db.delete(db_source)
+    await db.commit()
+    return True
+
+
+async def toggle_news_source(db: AsyncSession, source_id: int):
+    db_source = await get_news_source(db, source_id)
+    if not db_source:
+        return None
+    db_source.is_active = not db_source.is_active
+    await db.commit()
+    await db.refresh(db_source)
+    return db_source
@@ -1,6 +1,11 @@
+from datetime import timedelta
+from sqlalchemy import select, update, func, insert, case, exists
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from app.models import NewsItem, Post, NewsSource
+from app.config import settings
+from app.news_parser.fingerprint import simhash, lsh_bands, hamming_distance
+from app.models import NewsItem, Post, NewsSource, StatCounter
 from app.api.schemas import NewsItemCreate, NewsItemUpdate, PostCreate, PostUpdate, PostStatus, NewsSourceCreate, \
     NewsSourceUpdate
 import uuid
@@ -13,31 +18,148 @@ def get_news_item(db: Session, news_id: uuid.UUID):
     return db.query(NewsItem).filter(NewsItem.id == news_id).first()
 
 
-def get_news_items(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(NewsItem).offset(skip).limit(limit).all()
-
-
-def create_news_item(db: Session, news: NewsItemCreate):
-    db_news = NewsItem(**news.model_dump())
-    db.add(db_news)
-    db.commit()
-    db.refresh(db_news)
-    return db_news
-
-
-def create_news_item_if_not_exists(db: Session, news_data: dict):
-    # Проверяем по URL или заголовку
-    existing = db.query(NewsItem).filter(
-        (NewsItem.url == news_data["url"]) |
-        (NewsItem.title == news_data["title"])
-    ).first()
-
-    if not existing:
-        news_create = NewsItemCreate(**news_data)
-        return create_news_item(db, news_create)
-    else:
-        logger.debug(f"Skipping duplicate: {news_data['title']}")
-        return None
+def bulk_create_news_items(db: Session, items: list[dict], chunk_size: int = None) -> list[uuid.UUID]:
+    """
+    Массово сохраняет новости, пропуская дубли по URL или заголовку.
+    Пишет чанками через INSERT ... ON CONFLICT DO NOTHING RETURNING,
+    по одной транзакции на чанк. Возвращает id вставленных новостей.
+    """
+    chunk_size = chunk_size or settings.NEWS_INSERT_CHUNK_SIZE
+
+    # Дедупликация внутри пачки
+    rows = []
+    seen_urls, seen_titles = set(), set()
+    for item in items:
+        row = NewsItemCreate(**item).model_dump()
+        row["url"] = row["url"] or None
+        if row["title"] in seen_titles or (row["url"] and row["url"] in seen_urls):
+            continue
+        seen_titles.add(row["title"])
+        if row["url"]:
+            seen_urls.add(row["url"])
+        rows.append(row)
+
+    inserted = []
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        try:
+            # Дубли по URL отсекает уникальный индекс, по заголовку — этот запрос
+            existing_titles = set(db.scalars(
+                select(NewsItem.title).where(NewsItem.title.in_([row["title"] for row in chunk]))
+            ))
+            chunk = [row for row in chunk if row["title"] not in existing_titles]
+            if chunk:
+                values = []
+                for row in chunk:
+                    fingerprint = simhash(f"{row['title']}\n{row['raw_text'] or row['summary']}")
+                    values.append({
+                        "id": uuid.uuid4(),
+                        **row,
+                        "simhash": fingerprint,
+                        "simhash_bands": lsh_bands(fingerprint) if fingerprint is not None else None,
+                    })
+                stmt = (
+                    pg_insert(NewsItem)
+                    .values(values)
+                    .on_conflict_do_nothing(index_elements=[NewsItem.url])
+                    .returning(NewsItem.id)
+                )
+                chunk_ids = list(db.scalars(stmt))
+                link_near_duplicates(db, chunk_ids)
+                bump_counters(db, news_total=len(chunk_ids))
+                inserted.extend(chunk_ids)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+    logger.debug(f"Inserted {len(inserted)} of {len(items)} news items")
+    return inserted
+
+
+def link_near_duplicates(db: Session, news_ids: list[uuid.UUID]) -> int:
+    """
+    Привязывает только что вставленные новости к каноническим почти-дублям.
+    Кандидаты ищутся одним запросом по пересечению LSH-полос в окне
+    NEAR_DUPLICATE_WINDOW_HOURS, затем сверяются по расстоянию Хэмминга.
+    Возвращает число найденных дублей. Коммит — на вызывающей стороне.
+    """
+    if not news_ids:
+        return 0
+    new_items = db.execute(
+        select(NewsItem.id, NewsItem.simhash, NewsItem.simhash_bands, NewsItem.published_at)
+        .where(NewsItem.id.in_(news_ids), NewsItem.simhash.is_not(None))
+    ).all()
+    if not new_items:
+        return 0
+
+    window = timedelta(hours=settings.NEAR_DUPLICATE_WINDOW_HOURS)
+    bands = sorted({band for item in new_items for band in item.simhash_bands})
+    candidates = db.execute(
+        select(NewsItem.id, NewsItem.simhash, NewsItem.published_at)
+        .where(
+            NewsItem.simhash_bands.overlap(bands),
+            NewsItem.canonical_id.is_(None),
+            NewsItem.published_at >= min(item.published_at for item in new_items) - window,
+            NewsItem.published_at <= max(item.published_at for item in new_items) + window,
+        )
+        .order_by(NewsItem.published_at, NewsItem.id)
+    ).all()
+
+    new_ids = {item.id for item in new_items}
+    # Новости из этой же пачки становятся каноническими по мере обхода
+    canonicals = [c for c in candidates if c.id not in new_ids]
+    links = []
+    for item in sorted(new_items, key=lambda i: i.published_at):
+        match = next(
+            (
+                c for c in canonicals
+                if abs(c.published_at - item.published_at) <= window
+                and hamming_distance(c.simhash, item.simhash) <= settings.NEAR_DUPLICATE_MAX_DISTANCE
+            ),
+            None
+        )
+        if match:
+            links.append({"id": item.id, "canonical_id": match.id, "generation_status": "duplicate"})
+        else:
+            canonicals.append(item)
+
+    if links:
+        db.execute(update(NewsItem), links)
+        logger.info(f"Linked {len(links)} near-duplicate news items")
+    return len(links)
+
+
+def near_duplicate_successor_query(news_id: uuid.UUID):
+    """Самый ранний почти-дубль новости — он становится каноническим, если её удаляют"""
+    return (
+        select(NewsItem.id)
+        .where(NewsItem.canonical_id == news_id)
+        .order_by(NewsItem.published_at, NewsItem.id)
+        .limit(1)
+    )
+
+
+def repoint_near_duplicates_statements(news_id: uuid.UUID, successor_id: uuid.UUID) -> list:
+    """
+    UPDATE-запросы перед удалением канонической новости: остальные дубли ссылаются на преемника,
+    а сам преемник становится каноническим и, если был только дублем, встаёт в очередь генерации.
+    """
+    return [
+        update(NewsItem)
+        .where(NewsItem.canonical_id == news_id, NewsItem.id != successor_id)
+        .values(canonical_id=successor_id)
+        .execution_options(synchronize_session=False),
+        update(NewsItem)
+        .where(NewsItem.id == successor_id)
+        .values(
+            canonical_id=None,
+            generation_status=case(
+                (NewsItem.generation_status == "duplicate", "pending"), else_=NewsItem.generation_status
+            ),
+        )
+        .execution_options(synchronize_session=False),
+    ]
 
 
 def update_news_item(db: Session, news_id: uuid.UUID, news_update: NewsItemUpdate):
@@ -56,7 +178,12 @@ def delete_news_item(db: Session, news_id: uuid.UUID):
     db_news = get_news_item(db, news_id)
     if not db_news:
         return False
+    successor_id = db.scalar(near_duplicate_successor_query(news_id))
+    if successor_id is not None:
+        for stmt in repoint_near_duplicates_statements(news_id, successor_id):
+            db.execute(stmt)
     db.delete(db_news)
+    bump_counters(db, news_total=-1)
     db.commit()
     return True
 
@@ -65,18 +192,17 @@ def get_post(db: Session, post_id: uuid.UUID):
     return db.query(Post).filter(Post.id == post_id).first()
 
 
-def get_posts(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(Post).offset(skip).limit(limit).all()
-
-
 def create_post(db: Session, post: PostCreate):
     # Проверяем, существует ли news_item
     news_item = db.query(NewsItem).filter(NewsItem.id == post.news_item_id).first()
     if not news_item:
         raise ValueError(f"NewsItem with id {post.news_item_id} not found")
 
+    has_posts = db.query(Post.id).filter(Post.news_item_id == post.news_item_id).first() is not None
     db_post = Post(**post.model_dump())
     db.add(db_post)
+    bump_counters(db, **{_status_counter(db_post.status): 1, "news_processed": 0 if has_posts else 1})
+    _set_generation_status(db, [post.news_item_id], "done")
     try:
         db.commit()
         db.refresh(db_post)
@@ -90,9 +216,12 @@ def update_post(db: Session, post_id: uuid.UUID, post_update: PostUpdate):
     db_post = get_post(db, post_id)
     if not db_post:
         return None
+    old_status = db_post.status
     for key, value in post_update.model_dump(exclude_unset=True).items():
         if value is not None:
             setattr(db_post, key, value)
+    if db_post.status != old_status:
+        bump_counters(db, **{_status_counter(old_status): -1, _status_counter(db_post.status): 1})
     db.commit()
     db.refresh(db_post)
     return db_post
@@ -102,47 +231,319 @@ def delete_post(db: Session, post_id: uuid.UUID):
     db_post = get_post(db, post_id)
     if not db_post:
         return False
+    other_posts = db.query(Post.id).filter(
+        Post.news_item_id == db_post.news_item_id, Post.id != db_post.id
+    ).first()
     db.delete(db_post)
+    bump_counters(db, **{_status_counter(db_post.status): -1, "news_processed": 0 if other_posts else -1})
+    if not other_posts:
+        # Как и раньше, новость без постов снова попадает в генерацию
+        _set_generation_status(db, [db_post.news_item_id], "pending")
     db.commit()
     return True
 
 
-def get_posts_by_status(db: Session, status: PostStatus, skip: int = 0, limit: int = 100):
-    return db.query(Post).filter(Post.status == status).offset(skip).limit(limit).all()
-
-
 def retry_failed_posts(db: Session):
     """Возвращает список ID постов со статусом 'failed'"""
     posts = db.query(Post).filter(Post.status == PostStatus.failed).all()
     for post in posts:
         post.status = PostStatus.draft
+    bump_counters(db, posts_failed=-len(posts), posts_draft=len(posts))
     db.commit()
     return [post.id for post in posts]
 
 
-def get_news_stats(db: Session):
-    total = db.query(NewsItem).count()
-    processed = db.query(NewsItem).join(Post).count()
+def bulk_create_posts(db: Session, rows: list[dict]) -> int:
+    """Вставляет сгенерированные посты одним INSERT и обновляет счётчики"""
+    if not rows:
+        return 0
+    news_ids = {row["news_item_id"] for row in rows}
+    already_processed = set(db.scalars(
+        select(Post.news_item_id).where(Post.news_item_id.in_(news_ids)).distinct()
+    ))
+    db.execute(insert(Post), rows)
+    _set_generation_status(db, news_ids, "done")
+    status_counts = {}
+    for row in rows:
+        key = _status_counter(row.get("status", PostStatus.draft))
+        status_counts[key] = status_counts.get(key, 0) + 1
+    bump_counters(db, news_processed=len(news_ids - already_processed), **status_counts)
+    db.commit()
+    return len(rows)
+
+
+def claim_news_for_generation(db: Session, limit: int, claim_status: str = "claimed",
+                              news_ids: list[uuid.UUID] = None) -> list:
+    """
+    Забирает до limit новостей из очереди генерации (только из news_ids, если они заданы).
+    Строки блокируются через FOR UPDATE SKIP LOCKED, поэтому параллельные воркеры
+    получают непересекающиеся пачки. Возвращает только id, title и summary.
+    """
+    candidates = (
+        select(NewsItem.id)
+        .where(NewsItem.generation_status == "pending")
+        .order_by(NewsItem.published_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    if news_ids is not None:
+        candidates = candidates.where(NewsItem.id.in_(news_ids))
+    has_post = exists().where(Post.news_item_id == NewsItem.id)
+    stmt = (
+        update(NewsItem)
+        .where(NewsItem.id.in_(candidates.scalar_subquery()))
+        .values(
+            # Новости, у которых пост уже есть (например, старые строки после миграции), просто закрываем
+            generation_status=case((has_post, "done"), else_=claim_status),
+            generation_claimed_at=func.now(),
+        )
+        .returning(NewsItem.id, NewsItem.title, NewsItem.summary, NewsItem.generation_status)
+        .execution_options(synchronize_session=False)
+    )
+    rows = db.execute(stmt).all()
+    db.commit()
+    return rows
+
+
+def requeue_values(count_attempt: bool = True) -> dict:
+    """
+    Значения для возврата новости в очередь генерации. Неудачная попытка засчитывается,
+    и после GENERATION_MAX_ATTEMPTS новость получает конечный статус 'failed',
+    чтобы модель, стабильно отвергающая новость, не оплачивалась на каждом запуске.
+    """
+    attempts = NewsItem.generation_attempts + (1 if count_attempt else 0)
     return {
-        "total": total,
-        "processed": processed,
-        "unprocessed": total - processed
+        "generation_attempts": attempts,
+        "generation_status": case((attempts >= settings.GENERATION_MAX_ATTEMPTS, "failed"), else_="pending"),
+        "generation_claimed_at": None,
+        "generation_batch_id": None,
     }
 
 
-def get_posts_stats(db: Session):
-    total = db.query(Post).count()
-    draft = db.query(Post).filter(Post.status == "draft").count()
-    published = db.query(Post).filter(Post.status == "published").count()
-    failed = db.query(Post).filter(Post.status == "failed").count()
+def release_news_claims(db: Session, news_ids: list[uuid.UUID], count_attempt: bool = True):
+    """
+    Возвращает новости в очередь генерации после неудачи.
+    count_attempt=False — неудача не связана с самими новостями (например, не отправился батч).
+    """
+    if news_ids:
+        statuses = db.scalars(
+            update(NewsItem)
+            .where(NewsItem.id.in_(news_ids), NewsItem.generation_status != "done")
+            .values(**requeue_values(count_attempt))
+            .returning(NewsItem.generation_status)
+            .execution_options(synchronize_session=False)
+        ).all()
+        db.commit()
+        _log_failed_generation(statuses.count("failed"))
+
+
+def requeue_stale_generation_claims(db: Session, timeout: int) -> int:
+    """
+    Возвращает в очередь новости, которые воркер взял, но не обработал за timeout секунд.
+    Попытка засчитывается: новость, на которой воркер падает, не должна браться бесконечно.
+    """
+    statuses = db.scalars(
+        update(NewsItem)
+        .where(
+            NewsItem.generation_status == "claimed",
+            NewsItem.generation_claimed_at < func.now() - timedelta(seconds=timeout)
+        )
+        .values(**requeue_values())
+        .returning(NewsItem.generation_status)
+        .execution_options(synchronize_session=False)
+    ).all()
+    count = len(statuses)
+    db.commit()
+    if count:
+        logger.warning(f"Requeued {count} stale generation claims")
+    _log_failed_generation(statuses.count("failed"))
+    return count
+
+
+def _log_failed_generation(count: int):
+    if count:
+        logger.warning(
+            f"{count} news items failed generation {settings.GENERATION_MAX_ATTEMPTS} times and will not be retried"
+        )
+
+
+def _set_generation_status(db: Session, news_ids, status: str):
+    db.query(NewsItem).filter(NewsItem.id.in_(list(news_ids))).update(
+        {"generation_status": status}, synchronize_session=False
+    )
+
+
+def set_post_status(db: Session, post: Post, status: str):
+    old_status = post.status
+    post.status = status
+    if status != old_status:
+        bump_counters(db, **{_status_counter(old_status): -1, _status_counter(status): 1})
+    db.commit()
+
+
+def claim_posts_for_publishing(db: Session, limit: int) -> list:
+    """
+    Атомарно переводит до limit черновиков в статус 'publishing'.
+    FOR UPDATE SKIP LOCKED гарантирует, что параллельные воркеры не получат один пост дважды.
+    Возвращает id, title и content забранных постов.
+    """
+    candidates = (
+        select(Post.id)
+        .where(Post.status == "draft")
+        .order_by(Post.created_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    stmt = (
+        update(Post)
+        .where(Post.id.in_(candidates.scalar_subquery()))
+        .values(status="publishing", publish_claimed_at=func.now())
+        .returning(Post.id, Post.title, Post.content)
+        .execution_options(synchronize_session=False)
+    )
+    rows = db.execute(stmt).all()
+    bump_counters(db, posts_draft=-len(rows), posts_publishing=len(rows))
+    db.commit()
+    return rows
+
+
+def finish_post_publishing(db: Session, post_id: uuid.UUID, status: str) -> bool:
+    """
+    Завершает публикацию поста: 'publishing' -> 'published' или 'failed'.
+    Если пост уже сняли по таймауту, а сообщение всё-таки ушло, он всё равно
+    помечается опубликованным, чтобы повтор ошибок не дал дубль.
+    Возвращает False, если пост уже не в статусе 'publishing'.
+    """
+    post = db.query(Post).filter(Post.id == post_id).with_for_update().first()
+    if post is None:
+        db.rollback()
+        return False
+    claimed = post.status == "publishing"
+    if claimed or (status == "published" and post.status == "failed"):
+        post.publish_claimed_at = None
+        set_post_status(db, post, status)
+    else:
+        db.rollback()
+    return claimed
+
+
+def fail_stale_publishing_posts(db: Session, timeout: int) -> int:
+    """
+    Помечает как 'failed' посты, застрявшие в 'publishing' дольше timeout секунд.
+    Обратно в черновики их не возвращаем: сообщение могло уйти, и повтор дал бы дубль в канале.
+    """
+    count = db.query(Post).filter(
+        Post.status == "publishing",
+        Post.publish_claimed_at < func.now() - timedelta(seconds=timeout)
+    ).update({"status": "failed", "publish_claimed_at": None}, synchronize_session=False)
+    bump_counters(db, posts_publishing=-count, posts_failed=count)
+    db.commit()
+    if count:
+        logger.warning(f"Marked {count} stale publishing posts as failed")
+    return count
+
+
+def _status_counter(status) -> str:
+    # PostStatus — str-enum, но f-строка от него дала бы 'PostStatus.draft'
+    return f"posts_{getattr(status, 'value', status)}"
+
+
+def bump_counters(db: Session, **deltas: int):
+    """
+    Прибавляет значения к счётчикам дашборда в текущей транзакции.
+    Коммит — на вызывающей стороне, поэтому счётчик меняется атомарно с данными.
+    """
+    stmt = counters_increment_statement(deltas)
+    if stmt is not None:
+        db.execute(stmt)
+
+
+def counters_increment_statement(deltas: dict):
+    """UPSERT, прибавляющий deltas к счётчикам; None, если прибавлять нечего"""
+    # Строки блокируются в порядке VALUES: всегда по имени, чтобы встречные транзакции не ловили deadlock
+    values = [{"name": name, "value": delta} for name, delta in sorted(deltas.items()) if delta]
+    if not values:
+        return None
+    stmt = pg_insert(StatCounter).values(values)
+    return stmt.on_conflict_do_update(
+        index_elements=[StatCounter.name],
+        set_={"value": StatCounter.value + stmt.excluded.value}
+    )
+
+
+def counters_replace_statement(counters: dict):
+    """UPSERT, записывающий значения счётчиков целиком"""
+    stmt = pg_insert(StatCounter).values([{"name": name, "value": value} for name, value in sorted(counters.items())])
+    return stmt.on_conflict_do_update(index_elements=[StatCounter.name], set_={"value": stmt.excluded.value})
+
+
+def counters_lock_statements(names) -> list:
+    """
+    Блокирует строки счётчиков (создавая недостающие) до пересчёта по таблицам:
+    иначе прибавка, закоммиченная между подсчётом и перезаписью, потерялась бы.
+    """
+    names = sorted(names)
+    return [
+        pg_insert(StatCounter).values([{"name": name, "value": 0} for name in names]).on_conflict_do_nothing(),
+        select(StatCounter.name).where(StatCounter.name.in_(names)).order_by(StatCounter.name).with_for_update(),
+    ]
+
+
+def stat_counter_names() -> list:
+    return [_status_counter(status) for status in PostStatus] + ["news_total", "news_processed", "initialized"]
+
+
+def rebuild_stat_counters(db: Session) -> dict:
+    """Пересчитывает счётчики по таблицам: первичное заполнение и исправление расхождений"""
+    for stmt in counters_lock_statements(stat_counter_names()):
+        db.execute(stmt)
+    counters = {_status_counter(status): 0 for status in PostStatus}
+    counters.update({
+        _status_counter(status): count
+        for status, count in db.query(Post.status, func.count(Post.id)).group_by(Post.status)
+    })
+    counters["news_total"] = db.query(func.count(NewsItem.id)).scalar()
+    counters["news_processed"] = db.query(func.count(func.distinct(Post.news_item_id))).scalar()
+    # Метка: счётчики посчитаны по таблицам, а не накоплены с нуля после миграции
+    counters["initialized"] = 1
+
+    db.execute(counters_replace_statement(counters))
+    db.commit()
+    return counters
+
+
+def get_stat_counters(db: Session) -> dict:
+    counters = dict(db.query(StatCounter.name, StatCounter.value).all())
+    if "initialized" not in counters:
+        counters = rebuild_stat_counters(db)
+    return counters
+
+
+def get_news_stats(db: Session, counters: dict = None):
+    return news_stats_from_counters(counters or get_stat_counters(db))
+
+
+def get_posts_stats(db: Session, counters: dict = None):
+    return posts_stats_from_counters(counters or get_stat_counters(db))
+
+
+def news_stats_from_counters(counters: dict) -> dict:
+    total = counters.get("news_total", 0)
+    processed = counters.get("news_processed", 0)
     return {
         "total": total,
-        "draft": draft,
-        "published": published,
-        "failed": failed
+        "processed": processed,
+        "unprocessed": total - processed
     }
 
 
+def posts_stats_from_counters(counters: dict) -> dict:
+    stats = {status.value: counters.get(_status_counter(status), 0) for status in PostStatus}
+    # Посты с нестандартным статусом (через PUT /posts/) тоже учитываются в общем числе
+    stats["total"] = sum(value for name, value in counters.items() if name.startswith("posts_"))
+    return stats
+
+
 def get_news_source(db: Session, source_id: int):
     return db.query(NewsSource).filter(NewsSource.id == source_id).first()
 
@@ -163,6 +564,9 @@ def update_news_source(db: Session, source_id: int, source_update: NewsSourceUpd
     db_source = get_news_source(db, source_id)
     if not db_source:
         return None
+    if source_update.url is not None and source_update.url != db_source.url:
+        # Валидаторы старого адреса к новой ленте не относятся
+        db_source.etag = db_source.last_modified = db_source.content_hash = None
     for key, value in source_update.model_dump(exclude_unset=True).items():
         if value is not None:
             setattr(db_source, key, value)
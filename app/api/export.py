@@ -0,0 +1,111 @@
+import csv
+import io
+import json
+import uuid
+from datetime import datetime
+from typing import Iterator
+
+from sqlalchemy import select
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import NewsItem, Post
+
+# Колонки, доступные для выгрузки; порядок — порядок по умолчанию
+NEWS_EXPORT_COLUMNS = {
+    "id": NewsItem.id,
+    "title": NewsItem.title,
+    "url": NewsItem.url,
+    "summary": NewsItem.summary,
+    "source": NewsItem.source,
+    "published_at": NewsItem.published_at,
+    "canonical_id": NewsItem.canonical_id,
+    "generation_status": NewsItem.generation_status,
+}
+
+POST_EXPORT_COLUMNS = {
+    "id": Post.id,
+    "title": Post.title,
+    "content": Post.content,
+    "status": Post.status,
+    "news_item_id": Post.news_item_id,
+    "created_at": Post.created_at,
+}
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def resolve_columns(available: dict, fields: str = None) -> dict:
+    """
+    Разбирает параметр fields ("id,title,...") в набор колонок.
+    На неизвестное поле бросает ValueError.
+    """
+    if not fields:
+        return available
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown or not names:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return {name: available[name] for name in names}
+
+
+def stream_export(columns: dict, export_format: str, where=None, order_by=None) -> Iterator[str]:
+    """
+    Построчно выгружает таблицу в NDJSON или CSV.
+    Читает только нужные колонки через серверный курсор (yield_per), поэтому
+    память не зависит от числа строк. Сессия своя: генератор живёт дольше запроса.
+    """
+    stmt = select(*columns.values())
+    if where is not None:
+        stmt = stmt.where(where)
+    if order_by is not None:
+        stmt = stmt.order_by(*order_by)
+    names = list(columns)
+    encode = _encode_csv if export_format == "csv" else _encode_ndjson
+
+    if export_format == "csv":
+        # Заголовок отдаём сразу, ещё до первого обращения к БД
+        yield _encode_csv([names])
+
+    db = SessionLocal()
+    try:
+        result = db.execute(stmt.execution_options(yield_per=settings.EXPORT_BATCH_SIZE))
+        for rows in result.partitions():
+            yield encode(rows, names)
+    finally:
+        db.close()
+
+
+def stream_news(columns: dict, export_format: str) -> Iterator[str]:
+    return stream_export(columns, export_format, order_by=[NewsItem.published_at, NewsItem.id])
+
+
+def stream_posts(columns: dict, export_format: str, status: str = None) -> Iterator[str]:
+    where = Post.status == getattr(status, "value", status) if status else None
+    return stream_export(columns, export_format, where=where, order_by=[Post.created_at, Post.id])
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _encode_ndjson(rows, names) -> str:
+    return "".join(
+        json.dumps(dict(zip(names, row)), ensure_ascii=False, default=_json_default) + "\n"
+        for row in rows
+    )
+
+
+def _encode_csv(rows, names=None) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(value.isoformat() if isinstance(value, datetime) else value for value in row)
+    return buffer.getvalue()
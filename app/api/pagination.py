@@ -0,0 +1,53 @@
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Optional, Tuple, Union
+
+from sqlalchemy import tuple_
+
+
+SortValue = Union[datetime, float]
+
+
+def encode_cursor(sort_value: SortValue, item_id: uuid.UUID) -> str:
+    """Непрозрачный курсор: позиция последнего элемента страницы (дата или число, например ранг поиска)"""
+    value = sort_value.isoformat() if isinstance(sort_value, datetime) else sort_value
+    raw = json.dumps([value, str(item_id)])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_type: type = datetime) -> Tuple[SortValue, uuid.UUID]:
+    """Разбирает курсор; на повреждённый курсор или курсор другой сортировки бросает ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_value, item_id = json.loads(raw)
+        if sort_type is datetime:
+            sort_value = datetime.fromisoformat(sort_value)
+        elif isinstance(sort_value, bool) or not isinstance(sort_value, (int, float)):
+            raise ValueError
+        return sort_value, uuid.UUID(item_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def keyset_query(query, sort_column, id_column, cursor: Optional[str], limit: int, sort_type: type = datetime):
+    """
+    Страница по ключу (sort_column, id_column) от новых к старым: добавляет к select()
+    условие по курсору, сортировку и limit + 1. Вместо OFFSET фильтрует по позиции последнего
+    элемента прошлой страницы, поэтому глубокие страницы стоят столько же, сколько первая.
+    sort_column может быть и выражением (например, рангом поиска), тогда sort_type=float.
+    """
+    if cursor:
+        query = query.filter(tuple_(sort_column, id_column) < tuple_(*decode_cursor(cursor, sort_type)))
+    return query.order_by(sort_column.desc(), id_column.desc()).limit(limit + 1)
+
+
+def split_page(rows: list, sort_column, id_column, limit: int):
+    """Отрезает лишнюю строку и строит по последнему элементу курсор следующей страницы"""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
+    return rows, next_cursor
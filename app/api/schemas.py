@@ -26,13 +26,29 @@ class NewsItemUpdate(NewsItemBase):
 
 class NewsItemRead(NewsItemBase):
     id: uuid.UUID
+    canonical_id: Optional[uuid.UUID] = None
 
     class Config:
         from_attributes = True  # для SQLAlchemy 2.0+
 
 
+class NewsItemPage(BaseModel):
+    items: list[NewsItemRead]
+    next_cursor: Optional[str] = None
+
+
+class NewsSearchResult(NewsItemRead):
+    rank: float
+
+
+class NewsSearchPage(BaseModel):
+    items: list[NewsSearchResult]
+    next_cursor: Optional[str] = None
+
+
 class PostStatus(str, Enum):
     draft = "draft"
+    publishing = "publishing"
     published = "published"
     failed = "failed"
 
@@ -62,6 +78,11 @@ class PostRead(PostBase):
         from_attributes = True
 
 
+class PostPage(BaseModel):
+    items: list[PostRead]
+    next_cursor: Optional[str] = None
+
+
 class StatsResponse(BaseModel):
     news_total: int
     news_processed: int
@@ -8,13 +8,82 @@ class Settings:
     TELEGRAM_SESSION_NAME: str = os.getenv("TELEGRAM_SESSION_NAME", "aibot_session")
     TELEGRAM_CHANNEL_USERNAME: str = os.getenv("TELEGRAM_CHANNEL_USERNAME", "")
     MAX_POSTS_PER_PUBLISH: int = int(os.getenv("MAX_POSTS_PER_PUBLISH", "5"))
+    # Через сколько секунд пост, застрявший в статусе publishing, считается неудачным
+    PUBLISH_CLAIM_TIMEOUT: int = int(os.getenv("PUBLISH_CLAIM_TIMEOUT", "600"))
+    # Загрузка каналов: параллельность, первая выборка и максимум новых сообщений за запуск
+    TELEGRAM_FETCH_CONCURRENCY: int = int(os.getenv("TELEGRAM_FETCH_CONCURRENCY", "4"))
+    TELEGRAM_INITIAL_FETCH_LIMIT: int = int(os.getenv("TELEGRAM_INITIAL_FETCH_LIMIT", "15"))
+    TELEGRAM_FETCH_MAX_MESSAGES: int = int(os.getenv("TELEGRAM_FETCH_MAX_MESSAGES", "500"))
+    TELEGRAM_FLOOD_RETRIES: int = int(os.getenv("TELEGRAM_FLOOD_RETRIES", "2"))
+    # Издатель держит постоянное подключение в отдельном процессе Celery (очередь PUBLISH_QUEUE, -c 1)
+    # на своей сессии: два клиента на одном SQLite-файле сессии ловят «database is locked»
+    TELEGRAM_PUBLISHER_SESSION_NAME: str = os.getenv(
+        "TELEGRAM_PUBLISHER_SESSION_NAME", f"{TELEGRAM_SESSION_NAME}_publisher"
+    )
+    TELEGRAM_KEEPALIVE_INTERVAL: int = int(os.getenv("TELEGRAM_KEEPALIVE_INTERVAL", "30"))
+    TELEGRAM_SEND_TIMEOUT: int = int(os.getenv("TELEGRAM_SEND_TIMEOUT", "120"))
+    # FloodWait длиннее этого значения не пережидаем, пост уходит в failed
+    TELEGRAM_MAX_FLOOD_WAIT: int = int(os.getenv("TELEGRAM_MAX_FLOOD_WAIT", "60"))
+    # Push-сбор (app.news_parser.telegram_listener): своя сессия, чтобы не делить с воркером SQLite-файл
+    # и ключ авторизации (авторизуется отдельно: python -m app.telegram.auth --listener);
+    # пачка сохраняется по размеру или по интервалу, список каналов перечитывается из БД
+    TELEGRAM_LISTENER_SESSION_NAME: str = os.getenv("TELEGRAM_LISTENER_SESSION_NAME", f"{TELEGRAM_SESSION_NAME}_listener")
+    TELEGRAM_LISTENER_BATCH_SIZE: int = int(os.getenv("TELEGRAM_LISTENER_BATCH_SIZE", "50"))
+    TELEGRAM_LISTENER_FLUSH_INTERVAL: float = float(os.getenv("TELEGRAM_LISTENER_FLUSH_INTERVAL", "5"))
+    TELEGRAM_LISTENER_REFRESH_INTERVAL: int = int(os.getenv("TELEGRAM_LISTENER_REFRESH_INTERVAL", "60"))
+    TELEGRAM_LISTENER_JOIN_CHANNELS: bool = os.getenv("TELEGRAM_LISTENER_JOIN_CHANNELS", "false").lower() == "true"
+
+    # RSS
+    FEED_FETCH_CONCURRENCY: int = int(os.getenv("FEED_FETCH_CONCURRENCY", "32"))
+    FEED_FETCH_PER_HOST: int = int(os.getenv("FEED_FETCH_PER_HOST", "2"))
+    FEED_FETCH_TIMEOUT: float = float(os.getenv("FEED_FETCH_TIMEOUT", "20"))
+    # Бюджет токенов для очищенного текста новости (по оценке estimate_tokens), 0 — без обрезки
+    SUMMARY_MAX_TOKENS: int = int(os.getenv("SUMMARY_MAX_TOKENS", "600"))
+    # Потоковый разбор простых лент без feedparser; нестандартные ленты всё равно идут через feedparser
+    FEED_FAST_PARSER: bool = os.getenv("FEED_FAST_PARSER", "true").lower() == "true"
 
     # OpenAI
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     OPENAI_MODEL: str = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+    # Пустое значение — официальный API; можно указать локальную заглушку (scripts/fake_openai.py)
+    OPENAI_BASE_URL: str = os.getenv("OPENAI_BASE_URL", "")
+    # realtime — chat completions по одной новости, batch — через OpenAI Batch API
+    GENERATION_MODE: str = os.getenv("GENERATION_MODE", "realtime")
+    GENERATION_BATCH_MAX_ITEMS: int = int(os.getenv("GENERATION_BATCH_MAX_ITEMS", "1000"))
+    # Сбор сразу ставит генерацию новых новостей, генерация — публикацию; beat остаётся страховкой
+    PIPELINE_CHAINING: bool = os.getenv("PIPELINE_CHAINING", "true").lower() == "true"
+    # Сколько новостей воркер забирает из очереди за раз и через сколько секунд взятая новость считается брошенной
+    GENERATION_CLAIM_BATCH_SIZE: int = int(os.getenv("GENERATION_CLAIM_BATCH_SIZE", "32"))
+    GENERATION_CLAIM_TIMEOUT: int = int(os.getenv("GENERATION_CLAIM_TIMEOUT", "1800"))
+    # После стольких неудачных попыток новость получает статус failed и больше не генерируется
+    GENERATION_MAX_ATTEMPTS: int = int(os.getenv("GENERATION_MAX_ATTEMPTS", "3"))
+    # Сколько новостей отправлять в LLM одним запросом (1 — по одной, ответ обычным текстом)
+    # и сколько раз повторять новости, для которых пост не прошёл проверку
+    GENERATION_ITEMS_PER_REQUEST: int = int(os.getenv("GENERATION_ITEMS_PER_REQUEST", "5"))
+    GENERATION_ENTRY_RETRIES: int = int(os.getenv("GENERATION_ENTRY_RETRIES", "1"))
+    # Параллельность и лимиты OpenAI действуют на процесс-воркер, общие для всех его задач
+    LLM_CONCURRENCY: int = int(os.getenv("LLM_CONCURRENCY", "8"))
+    LLM_REQUESTS_PER_MINUTE: int = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "500"))
+    LLM_TOKENS_PER_MINUTE: int = int(os.getenv("LLM_TOKENS_PER_MINUTE", "200000"))
+    POSTS_INSERT_BATCH_SIZE: int = int(os.getenv("POSTS_INSERT_BATCH_SIZE", "50"))
 
     # Database
     DATABASE_URL: str = os.getenv("DATABASE_URL", "postgresql+psycopg://localhost:5432/aibotdb")
+    NEWS_INSERT_CHUNK_SIZE: int = int(os.getenv("NEWS_INSERT_CHUNK_SIZE", "500"))
+    # Пул соединений каждого процесса (API-воркер, дочерний процесс Celery)
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT: int = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+    # Подключение через PgBouncer (transaction pooling): без своего пула и подготовленных выражений
+    DB_PGBOUNCER: bool = os.getenv("DB_PGBOUNCER", "false").lower() == "true"
+
+    # Поиск почти-дублей новостей (SimHash)
+    NEAR_DUPLICATE_WINDOW_HOURS: int = int(os.getenv("NEAR_DUPLICATE_WINDOW_HOURS", "48"))
+    NEAR_DUPLICATE_MAX_DISTANCE: int = int(os.getenv("NEAR_DUPLICATE_MAX_DISTANCE", "6"))
+    # Сколько строк за раз читается из серверного курсора при выгрузке
+    EXPORT_BATCH_SIZE: int = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
 
     # Redis / Celery
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379")
@@ -22,6 +91,22 @@ class Settings:
     CELERY_RESULT_BACKEND: str = os.getenv("CELERY_RESULT_BACKEND", f"{REDIS_URL}/1")
     OPENAI_PROXY_URL: str = os.getenv("OPENAI_PROXY_URL", "")
 
+    # Кэш ответов LLM: redis, sqlite или none
+    LLM_CACHE_BACKEND: str = os.getenv("LLM_CACHE_BACKEND", "redis")
+    LLM_CACHE_REDIS_URL: str = os.getenv("LLM_CACHE_REDIS_URL", f"{REDIS_URL}/2")
+    LLM_CACHE_SQLITE_PATH: str = os.getenv("LLM_CACHE_SQLITE_PATH", "llm_cache.sqlite3")
+    LLM_CACHE_TTL: int = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+    LLM_CACHE_MAX_ENTRIES: int = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "100000"))
+
+    # Метрики Prometheus: порт экспортера Celery-воркера (0 — не запускать)
+    METRICS_WORKER_PORT: int = int(os.getenv("METRICS_WORKER_PORT", "9100"))
+
+    # Профилирование задач и HTTP-запросов (cProfile): доля запусков, каталог и сколько запусков хранить
+    PROFILING_ENABLED: bool = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+    PROFILING_SAMPLE_RATE: float = float(os.getenv("PROFILING_SAMPLE_RATE", "1.0"))
+    PROFILING_DIR: str = os.getenv("PROFILING_DIR", "profiles")
+    PROFILING_KEEP: int = int(os.getenv("PROFILING_KEEP", "50"))
+
     # Auth
     ADMIN_API_KEY: str = os.getenv("ADMIN_API_KEY", "")
 
@@ -1,13 +1,151 @@
+import threading
+import time
 from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool, NullPool
 from app.config import settings
+from app.metrics import DB_POOL_TIMEOUTS, DB_POOL_WAIT_SECONDS
+
+
+class PoolStats:
+    """
+    Счётчики выдачи соединений из пула: сколько выдано, сколько ждали, сколько раз не дождались.
+    Те же данные уходят в метрики Prometheus, так что видны и пулы дочерних процессов Celery
+    """
+
+    def __init__(self, engine_name: str):
+        self.engine_name = engine_name
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_checkout(self, wait: float):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+        DB_POOL_WAIT_SECONDS.labels(self.engine_name).observe(wait)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+        DB_POOL_TIMEOUTS.labels(self.engine_name).inc()
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+            }
+
+
+def _instrumented_pool(pool_class, stats: PoolStats):
+    """Подкласс пула, который замеряет время получения соединения"""
+
+    class InstrumentedPool(pool_class):
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except PoolTimeoutError:
+                stats.record_timeout()
+                raise
+            stats.record_checkout(time.perf_counter() - started)
+            return connection
+
+    InstrumentedPool.__name__ = f"Instrumented{pool_class.__name__}"
+    return InstrumentedPool
+
+
+def _engine_options(pool_class, stats: PoolStats) -> dict:
+    if settings.DB_PGBOUNCER:
+        # PgBouncer в режиме transaction сам держит пул: соединение не удерживаем,
+        # а подготовленные выражения psycopg отключаем — они привязаны к серверному соединению
+        return {
+            "poolclass": _instrumented_pool(NullPool, stats),
+            "connect_args": {"prepare_threshold": None},
+        }
+    return {
+        "poolclass": _instrumented_pool(pool_class, stats),
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+engine = None
+async_engine = None
+pool_stats = {"sync": PoolStats("sync"), "async": PoolStats("async")}
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+# Асинхронная сессия для FastAPI: тот же URL, psycopg работает в обоих режимах
+AsyncSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False)
+
+
+def init_engines():
+    """
+    Создаёт движки и пулы текущего процесса.
+    Вызывается при импорте и заново в каждом дочернем процессе Celery:
+    соединения, унаследованные через fork, не закрываются (они принадлежат родителю),
+    а просто забываются.
+    """
+    global engine, async_engine
+    if engine is not None:
+        engine.dispose(close=False)
+    if async_engine is not None:
+        async_engine.sync_engine.dispose(close=False)
+
+    pool_stats["sync"], pool_stats["async"] = PoolStats("sync"), PoolStats("async")
+    engine = create_engine(settings.DATABASE_URL, **_engine_options(QueuePool, pool_stats["sync"]))
+    async_engine = create_async_engine(
+        settings.DATABASE_URL, **_engine_options(AsyncAdaptedQueuePool, pool_stats["async"])
+    )
+    SessionLocal.configure(bind=engine)
+    AsyncSessionLocal.configure(bind=async_engine)
+
+
+def dispose_engines():
+    if engine is not None:
+        engine.dispose()
+    if async_engine is not None:
+        # Асинхронные соединения закрыть без цикла событий нельзя — просто отпускаем пул
+        async_engine.sync_engine.dispose(close=False)
+
+
+def get_pool_status() -> dict:
+    """Состояние пулов текущего процесса и статистика ожидания соединений"""
+    status = {"pgbouncer": settings.DB_PGBOUNCER}
+    for name, current in (("sync", engine), ("async", async_engine)):
+        pool = current.pool if name == "sync" else current.sync_engine.pool
+        status[name] = {
+            "pool": type(pool).__name__,
+            "size": pool.size() if hasattr(pool, "size") else 0,
+            "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+            "overflow": pool.overflow() if hasattr(pool, "overflow") else 0,
+            **pool_stats[name].as_dict(),
+        }
+    return status
+
+
+init_engines()
 
-engine = create_engine(settings.DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
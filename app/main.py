@@ -1,15 +1,20 @@
-from fastapi import FastAPI, Request, Depends, HTTPException, status
+from fastapi import FastAPI, Request, Depends, HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.openapi.docs import get_swagger_ui_html
 from sqlalchemy import text
-from app.database import get_db
+from app.database import get_async_db, get_pool_status
 from app.config import settings
 from app.logging_config import setup_logging
-from sqlalchemy.orm import Session
-from app.api import crud, schemas
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.api import async_crud, schemas
 from app.api.schemas import PostStatus
-from fastapi.responses import HTMLResponse
+from fastapi.responses import FileResponse, HTMLResponse, Response, StreamingResponse
 from app.auth import require_auth
 from app.auth import router as auth_router
+from app.api import export
+from app import metrics, profiling
+from app.ai.cache import get_llm_cache
+import time
 import uuid
 
 setup_logging()
@@ -21,6 +26,42 @@ app = FastAPI(
 app.include_router(auth_router)
 
 
+@app.middleware("http")
+async def observe_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # Шаблон пути, а не сам путь: иначе каждый id давал бы отдельный ряд метрики
+    route = request.scope.get("route")
+    metrics.HTTP_REQUEST_SECONDS.labels(
+        request.method, route.path if route else "unmatched", response.status_code
+    ).observe(time.perf_counter() - started)
+    return response
+
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    # cProfile работает на весь поток event loop: в профиль попадают и параллельные корутины,
+    # а второй одновременный запрос просто не профилируется
+    if request.url.path.startswith(("/profiles", "/metrics")):
+        return await call_next(request)
+    started = time.perf_counter()
+    profiler = profiling.start_profiler()
+    try:
+        return await call_next(request)
+    finally:
+        route = request.scope.get("route")
+        profiling.stop_profiler(
+            profiler, "http", f"{request.method} {route.path if route else 'unmatched'}",
+            time.perf_counter() - started
+        )
+
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    body, content_type = metrics.render_latest()
+    return Response(content=body, media_type=content_type)
+
+
 @app.get("/docs", include_in_schema=False)
 def protected_docs(request: Request):
     auth_check = require_auth(request)
@@ -30,18 +71,19 @@ def protected_docs(request: Request):
 
 
 @app.get("/", response_class=HTMLResponse)
-def dashboard(request: Request, db: Session = Depends(get_db)):
+async def dashboard(request: Request, db: AsyncSession = Depends(get_async_db)):
     # Проверяем аутентификацию
     auth_check = require_auth(request)
     if auth_check:
         return auth_check
 
     # Получаем статистику
-    news_stats = crud.get_news_stats(db)
-    posts_stats = crud.get_posts_stats(db)
+    counters = await async_crud.get_stat_counters(db)
+    news_stats = await async_crud.get_news_stats(db, counters)
+    posts_stats = await async_crud.get_posts_stats(db, counters)
 
     # Получаем источники
-    sources = crud.get_news_sources(db, limit=20)
+    sources = await async_crud.get_news_sources(db, limit=20)
 
     # Генерируем HTML для таблицы источников
     sources_html = ""
@@ -98,6 +140,7 @@ def dashboard(request: Request, db: Session = Depends(get_db)):
                 <h3>📝 Посты</h3>
                 <p><strong>Всего:</strong> {posts_stats['total']}</p>
                 <p><strong>Черновики:</strong> {posts_stats['draft']}</p>
+                <p><strong>Публикуются:</strong> {posts_stats['publishing']}</p>
                 <p><strong>Опубликовано:</strong> {posts_stats['published']}</p>
                 <p><strong>Ошибка:</strong> {posts_stats['failed']}</p>
                 <p><strong>Макс. за публикацию:</strong> {settings.MAX_POSTS_PER_PUBLISH}</p>
@@ -201,131 +244,244 @@ def dashboard(request: Request, db: Session = Depends(get_db)):
 
 
 @app.get("/health/db")
-def health_db(db=Depends(get_db)):
+async def health_db(db: AsyncSession = Depends(get_async_db)):
     try:
-        db.execute(text("SELECT 1"))
+        await db.execute(text("SELECT 1"))
         return {"db": "ok"}
     except Exception as e:
         return {"db": "error", "detail": str(e)}
 
 
-@app.get("/news/", response_model=list[schemas.NewsItemRead])
-def read_news_items(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_news_items(db, skip=skip, limit=limit)
+@app.get("/health/db-pool", response_model=dict)
+def health_db_pool():
+    """Пулы соединений этого процесса: занятость и время ожидания соединения"""
+    return get_pool_status()
+
+
+@app.get("/profiles/", response_model=list[dict])
+def read_profiles(request: Request):
+    """Последние сохранённые профили задач и запросов (при PROFILING_ENABLED=true)"""
+    if require_auth(request):
+        raise HTTPException(status_code=403, detail="Требуется авторизация")
+    return profiling.list_profiles()
+
+
+@app.get("/profiles/{name}")
+def read_profile(
+        name: str,
+        request: Request,
+        profile_format: str = Query("txt", alias="format", pattern="^(txt|pstats)$")
+):
+    """Текстовая сводка (format=txt) или файл pstats (format=pstats) одного профиля"""
+    if require_auth(request):
+        raise HTTPException(status_code=403, detail="Требуется авторизация")
+    path = profiling.profile_path(name, f".{profile_format}")
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if profile_format == "txt":
+        return FileResponse(path, media_type="text/plain; charset=utf-8")
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{name}.pstats")
+
+
+@app.get("/ai/cache-stats", response_model=dict)
+def llm_cache_stats():
+    """Попадания и промахи кэша ответов LLM"""
+    return get_llm_cache().stats()
+
+
+@app.get("/news/", response_model=schemas.NewsItemPage)
+async def read_news_items(
+        cursor: str = None,
+        limit: int = Query(100, ge=1, le=1000),
+        db: AsyncSession = Depends(get_async_db)
+):
+    try:
+        items, next_cursor = await async_crud.get_news_items(db, cursor=cursor, limit=limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"items": items, "next_cursor": next_cursor}
+
+
+@app.get("/news/search", response_model=schemas.NewsSearchPage)
+async def search_news_items(
+        q: str = Query(..., min_length=1, max_length=500),
+        sort: str = Query("rank", pattern="^(rank|date)$"),
+        cursor: str = None,
+        limit: int = Query(20, ge=1, le=100),
+        db: AsyncSession = Depends(get_async_db)
+):
+    """Полнотекстовый поиск новостей; sort=rank — по релевантности, sort=date — сначала свежие"""
+    try:
+        rows, next_cursor = await async_crud.search_news_items(db, q, sort=sort, cursor=cursor, limit=limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    items = [
+        {**schemas.NewsItemRead.model_validate(news).model_dump(), "rank": rank}
+        for news, rank in rows
+    ]
+    return {"items": items, "next_cursor": next_cursor}
+
+
+def _export_response(available: dict, fields: str, export_format: str, filename: str, stream):
+    try:
+        columns = export.resolve_columns(available, fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(
+        stream(columns, export_format),
+        media_type=export.EXPORT_FORMATS[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format}"'}
+    )
+
+
+@app.get("/news/export")
+def export_news_items(
+        export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+        fields: str = None
+):
+    """Потоковая выгрузка всех новостей в NDJSON или CSV; fields — список колонок через запятую"""
+    return _export_response(
+        export.NEWS_EXPORT_COLUMNS, fields, export_format, "news", export.stream_news
+    )
 
 
 @app.get("/news/{news_id}", response_model=schemas.NewsItemRead)
-def read_news_item(news_id: str, db: Session = Depends(get_db)):
+async def read_news_item(news_id: str, db: AsyncSession = Depends(get_async_db)):
     try:
         news_uuid = uuid.UUID(news_id)
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid UUID format")
-    news = crud.get_news_item(db, news_uuid)
+    news = await async_crud.get_news_item(db, news_uuid)
     if not news:
         raise HTTPException(status_code=404, detail="News item not found")
     return news
 
 
 @app.post("/news/", response_model=schemas.NewsItemRead, status_code=status.HTTP_201_CREATED)
-def create_news_item(news: schemas.NewsItemCreate, db: Session = Depends(get_db)):
-    return crud.create_news_item(db, news)
+async def create_news_item(news: schemas.NewsItemCreate, db: AsyncSession = Depends(get_async_db)):
+    try:
+        return await async_crud.create_news_item(db, news)
+    except async_crud.DuplicateNewsError as e:
+        raise HTTPException(status_code=409, detail=str(e))
 
 
 @app.put("/news/{news_id}", response_model=schemas.NewsItemRead)
-def update_news_item(news_id: str, news_update: schemas.NewsItemUpdate, db: Session = Depends(get_db)):
+async def update_news_item(news_id: str, news_update: schemas.NewsItemUpdate, db: AsyncSession = Depends(get_async_db)):
     try:
         news_uuid = uuid.UUID(news_id)
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid UUID format")
-    news = crud.update_news_item(db, news_uuid, news_update)
+    try:
+        news = await async_crud.update_news_item(db, news_uuid, news_update)
+    except async_crud.DuplicateNewsError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     if not news:
         raise HTTPException(status_code=404, detail="News item not found")
     return news
 
 
 @app.delete("/news/{news_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_news_item(news_id: str, db: Session = Depends(get_db)):
+async def delete_news_item(news_id: str, db: AsyncSession = Depends(get_async_db)):
     try:
         news_uuid = uuid.UUID(news_id)
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid UUID format")
-    success = crud.delete_news_item(db, news_uuid)
+    success = await async_crud.delete_news_item(db, news_uuid)
     if not success:
         raise HTTPException(status_code=404, detail="News item not found")
 
 
-@app.get("/posts/", response_model=list[schemas.PostRead])
-def read_posts(
+@app.get("/posts/", response_model=schemas.PostPage)
+async def read_posts(
         post_status: PostStatus = None,
-        skip: int = 0,
-        limit: int = 100,
-        db: Session = Depends(get_db)
+        cursor: str = None,
+        limit: int = Query(100, ge=1, le=1000),
+        db: AsyncSession = Depends(get_async_db)
+):
+    try:
+        if post_status:
+            items, next_cursor = await async_crud.get_posts_by_status(db, post_status, cursor=cursor, limit=limit)
+        else:
+            items, next_cursor = await async_crud.get_posts(db, cursor=cursor, limit=limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"items": items, "next_cursor": next_cursor}
+
+
+@app.get("/posts/export")
+def export_posts(
+        export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+        fields: str = None,
+        post_status: PostStatus = None
 ):
-    if post_status:
-        return crud.get_posts_by_status(db, post_status, skip=skip, limit=limit)
-    return crud.get_posts(db, skip=skip, limit=limit)
+    """Потоковая выгрузка постов в NDJSON или CSV; fields — список колонок через запятую"""
+    return _export_response(
+        export.POST_EXPORT_COLUMNS, fields, export_format, "posts",
+        lambda columns, fmt: export.stream_posts(columns, fmt, post_status)
+    )
 
 
 @app.post("/posts/retry-failed", response_model=list[uuid.UUID])
-def retry_failed_posts_endpoint(db: Session = Depends(get_db)):
+async def retry_failed_posts_endpoint(db: AsyncSession = Depends(get_async_db)):
     """Переводит все посты со статусом 'failed' в 'draft' для повторной публикации"""
-    return crud.retry_failed_posts(db)
+    return await async_crud.retry_failed_posts(db)
 
 
 @app.get("/posts/{post_id}", response_model=schemas.PostRead)
-def read_post(post_id: str, db: Session = Depends(get_db)):
+async def read_post(post_id: str, db: AsyncSession = Depends(get_async_db)):
     try:
         post_uuid = uuid.UUID(post_id)
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid UUID format")
-    post = crud.get_post(db, post_uuid)
+    post = await async_crud.get_post(db, post_uuid)
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     return post
 
 
 @app.post("/posts/", response_model=schemas.PostRead, status_code=status.HTTP_201_CREATED)
-def create_post(post: schemas.PostCreate, db: Session = Depends(get_db)):
+async def create_post(post: schemas.PostCreate, db: AsyncSession = Depends(get_async_db)):
     try:
-        return crud.create_post(db, post)
+        return await async_crud.create_post(db, post)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.put("/posts/{post_id}", response_model=schemas.PostRead)
-def update_post(post_id: str, post_update: schemas.PostUpdate, db: Session = Depends(get_db)):
+async def update_post(post_id: str, post_update: schemas.PostUpdate, db: AsyncSession = Depends(get_async_db)):
     try:
         post_uuid = uuid.UUID(post_id)
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid UUID format")
-    post = crud.update_post(db, post_uuid, post_update)
+    post = await async_crud.update_post(db, post_uuid, post_update)
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     return post
 
 
 @app.delete("/posts/{post_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_post(post_id: str, db: Session = Depends(get_db)):
+async def delete_post(post_id: str, db: AsyncSession = Depends(get_async_db)):
     try:
         post_uuid = uuid.UUID(post_id)
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid UUID format")
-    success = crud.delete_post(db, post_uuid)
+    success = await async_crud.delete_post(db, post_uuid)
     if not success:
         raise HTTPException(status_code=404, detail="Post not found")
 
 
 @app.post("/publish-posts/", response_model=dict)
-def trigger_publish_posts(db: Session = Depends(get_db)):
+async def trigger_publish_posts(db: AsyncSession = Depends(get_async_db)):
     """Запускает публикацию постов"""
     # Проверяем, есть ли черновики
-    draft_count = crud.get_posts_stats(db)["draft"]
+    draft_count = (await async_crud.get_posts_stats(db))["draft"]
     if draft_count == 0:
         return {"published": 0, "message": "Нет черновиков для публикации"}
 
     # Запускаем задачу
     from app.tasks import publish_posts_to_telegram
-    publish_posts_to_telegram.delay()
+    # Отправка в брокер блокирующая — не занимаем ею цикл событий
+    await run_in_threadpool(publish_posts_to_telegram.delay)
 
     return {
         "published": min(draft_count, settings.MAX_POSTS_PER_PUBLISH),
@@ -334,55 +490,51 @@ def trigger_publish_posts(db: Session = Depends(get_db)):
 
 
 @app.get("/sources/", response_model=list[schemas.NewsSourceRead])
-def read_news_sources(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_news_sources(db, skip=skip, limit=limit)
+async def read_news_sources(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_async_db)):
+    return await async_crud.get_news_sources(db, skip=skip, limit=limit)
 
 
 @app.get("/sources/{source_id}", response_model=schemas.NewsSourceRead)
-def read_news_source(source_id: int, db: Session = Depends(get_db)):
-    source = crud.get_news_source(db, source_id)
+async def read_news_source(source_id: int, db: AsyncSession = Depends(get_async_db)):
+    source = await async_crud.get_news_source(db, source_id)
     if not source:
         raise HTTPException(status_code=404, detail="Источник не найден")
     return source
 
 
 @app.post("/sources/", response_model=schemas.NewsSourceRead, status_code=status.HTTP_201_CREATED)
-def create_news_source(source: schemas.NewsSourceCreate, db: Session = Depends(get_db)):
-    return crud.create_news_source(db, source)
+async def create_news_source(source: schemas.NewsSourceCreate, db: AsyncSession = Depends(get_async_db)):
+    return await async_crud.create_news_source(db, source)
 
 
 @app.put("/sources/{source_id}", response_model=schemas.NewsSourceRead)
-def update_news_source(source_id: int, source_update: schemas.NewsSourceUpdate, db: Session = Depends(get_db)):
-    source = crud.update_news_source(db, source_id, source_update)
+async def update_news_source(source_id: int, source_update: schemas.NewsSourceUpdate, db: AsyncSession = Depends(get_async_db)):
+    source = await async_crud.update_news_source(db, source_id, source_update)
     if not source:
         raise HTTPException(status_code=404, detail="Источник не найден")
     return source
 
 
 @app.delete("/sources/{source_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_news_source(source_id: int, db: Session = Depends(get_db)):
-    success = crud.delete_news_source(db, source_id)
+async def delete_news_source(source_id: int, db: AsyncSession = Depends(get_async_db)):
+    success = await async_crud.delete_news_source(db, source_id)
     if not success:
         raise HTTPException(status_code=404, detail="Источник не найден")
 
 
 @app.post("/sources/{source_id}/toggle", response_model=schemas.NewsSourceRead)
-def toggle_source(
+async def toggle_source(
         source_id: int,
         request: Request,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     # Проверяем авторизацию
     auth_check = require_auth(request)
     if auth_check:
         raise HTTPException(status_code=403, detail="Требуется авторизация")
 
-    source = crud.get_news_source(db, source_id)
+    source = await async_crud.toggle_news_source(db, source_id)
     if not source:
         raise HTTPException(status_code=404, detail="Источник не найден")
 
-    source.is_active = not source.is_active
-    db.commit()
-    db.refresh(source)
-
     return source
\ No newline at end of file
@@ -0,0 +1,103 @@
+"""
+Метрики Prometheus для всего конвейера: сбор → генерация → публикация.
+
+API отдаёт их на /metrics, Celery-воркер — отдельным HTTP-экспортером (METRICS_WORKER_PORT).
+В prefork-воркере задачи выполняются в дочерних процессах, поэтому для него нужен
+multiprocess-режим prometheus_client: переменная PROMETHEUS_MULTIPROC_DIR должна быть
+задана до запуска процесса.
+"""
+import os
+import shutil
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+    start_http_server
+)
+
+# Сетевые операции: от десятков миллисекунд до минуты
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+# Задачи Celery могут идти минутами
+TASK_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+FEED_FETCH_SECONDS = Histogram(
+    "aibot_feed_fetch_seconds", "Загрузка одного источника (RSS-лента или Telegram-канал)",
+    ["parser", "source", "outcome"], buckets=LATENCY_BUCKETS
+)
+# stage: parsed — получено из источников, deduped — отброшено как дубль, inserted — сохранено
+NEWS_ITEMS = Counter("aibot_news_items_total", "Новости по этапам сбора", ["parser", "stage"])
+LLM_REQUEST_SECONDS = Histogram(
+    "aibot_llm_request_seconds", "Запрос к LLM на генерацию поста", ["outcome"], buckets=LATENCY_BUCKETS
+)
+LLM_TOKENS = Counter("aibot_llm_tokens_total", "Токены LLM по данным usage", ["kind"])
+LLM_CACHE_LOOKUPS = Counter("aibot_llm_cache_lookups_total", "Обращения к кэшу ответов LLM", ["result"])
+PUBLISH_SECONDS = Histogram(
+    "aibot_publish_seconds", "Отправка поста в Telegram-канал", ["outcome"], buckets=LATENCY_BUCKETS
+)
+PUBLISH_FAILURES = Counter("aibot_publish_failures_total", "Неудачные публикации по типу ошибки", ["error"])
+CELERY_TASK_SECONDS = Histogram(
+    "aibot_celery_task_seconds", "Длительность задач Celery", ["task", "state"], buckets=TASK_BUCKETS
+)
+# Ожидание соединения из пула БД: обычно доли миллисекунды, при исчерпании пула — до DB_POOL_TIMEOUT.
+# Число наблюдений — выданные соединения, сумма — суммарное ожидание
+DB_POOL_WAIT_SECONDS = Histogram(
+    "aibot_db_pool_wait_seconds", "Ожидание соединения из пула БД", ["engine"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)
+)
+DB_POOL_TIMEOUTS = Counter("aibot_db_pool_timeouts_total", "Соединение из пула БД не получено за DB_POOL_TIMEOUT",
+                           ["engine"])
+HTTP_REQUEST_SECONDS = Histogram(
+    "aibot_http_request_seconds", "Обработка HTTP-запроса до начала ответа", ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS
+)
+
+
+def multiprocess_enabled() -> bool:
+    return bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+
+def get_registry():
+    """Реестр для отдачи метрик: в multiprocess-режиме собирает файлы всех процессов"""
+    if not multiprocess_enabled():
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def render_latest():
+    """Тело и Content-Type ответа /metrics"""
+    return generate_latest(get_registry()), CONTENT_TYPE_LATEST
+
+
+def reset_multiprocess_dir():
+    """Удаляет файлы метрик прошлого запуска; вызывается главным процессом до старта дочерних"""
+    path = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if not path:
+        return
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def start_worker_exporter(port: int):
+    start_http_server(port, registry=get_registry())
+
+
+def mark_process_dead(pid: int):
+    # Gauge-метрики завершившегося процесса больше не нужны (счётчики и гистограммы сохраняются)
+    if multiprocess_enabled():
+        multiprocess.mark_process_dead(pid)
+
+
+def record_fetched_news(parser: str, parsed: int, inserted: int):
+    NEWS_ITEMS.labels(parser, "parsed").inc(parsed)
+    NEWS_ITEMS.labels(parser, "deduped").inc(parsed - inserted)
+    NEWS_ITEMS.labels(parser, "inserted").inc(inserted)
+
+
+def record_llm_usage(usage):
+    """Учитывает usage из ответа OpenAI (объект или dict из batch-результата)"""
+    if not usage:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        value = usage.get(kind) if isinstance(usage, dict) else getattr(usage, kind, None)
+        if value:
+            LLM_TOKENS.labels(kind.removesuffix("_tokens")).inc(value)
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Integer, Boolean
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Integer, Boolean, BigInteger, Index, Computed, text
+from sqlalchemy.dialects.postgresql import UUID, ARRAY, TSVECTOR
+from sqlalchemy.orm import deferred
 from sqlalchemy.ext.declarative import declarative_base
 import uuid
 from datetime import datetime
@@ -11,13 +12,50 @@ class NewsItem(Base):
     __tablename__ = "news_items"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    title = Column(String, nullable=False)
-    url = Column(String, nullable=True)
+    title = Column(String, nullable=False, index=True)
+    url = Column(String, nullable=True, unique=True)
     summary = Column(Text, nullable=False)
     source = Column(String, nullable=False)
     published_at = Column(DateTime, nullable=False, default=datetime.now)
     raw_text = Column(Text, nullable=True)
 
+    # SimHash текста и его LSH-полосы для поиска почти-дублей
+    simhash = Column(BigInteger, nullable=True)
+    simhash_bands = Column(ARRAY(Integer), nullable=True)
+    # Первая новость сюжета, если эта — её почти-дубль. При удалении канонической новости
+    # crud.delete_news_item переназначает дубли; SET NULL — страховка для удаления в обход API
+    canonical_id = Column(UUID(as_uuid=True), ForeignKey("news_items.id", ondelete="SET NULL"), nullable=True,
+                          index=True)
+    # Батч OpenAI Batch API, в котором новость ждёт генерации
+    generation_batch_id = Column(Integer, ForeignKey("generation_batches.id"), nullable=True, index=True)
+    # Очередь генерации: pending, claimed (взята воркером), batched (в Batch API), done, duplicate,
+    # failed (не удалось сгенерировать за GENERATION_MAX_ATTEMPTS попыток)
+    generation_status = Column(String, nullable=False, default="pending", server_default="pending")
+    generation_claimed_at = Column(DateTime, nullable=True)
+    generation_attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    # Полнотекстовый поиск: заголовок весит больше текста. Конфигурация russian стеммит
+    # кириллицу русским стеммером, а латиницу — английским, так что покрывает оба языка.
+    # Колонка не загружается вместе с новостью, она нужна только в условиях поиска
+    search_vector = deferred(Column(
+        TSVECTOR,
+        Computed(
+            "setweight(to_tsvector('russian', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('russian', coalesce(summary, '')), 'B')",
+            persisted=True,
+        ),
+    ))
+
+    __table_args__ = (
+        Index("ix_news_items_simhash_bands", simhash_bands, postgresql_using="gin"),
+        Index("ix_news_items_search_vector", "search_vector", postgresql_using="gin"),
+        # Keyset-пагинация /news/
+        Index("ix_news_items_published_at_id", published_at, id),
+        # Частичные индексы очереди генерации: только необработанные и взятые в работу новости
+        Index("ix_news_items_generation_pending", published_at, postgresql_where=text("generation_status = 'pending'")),
+        Index("ix_news_items_generation_claimed", generation_claimed_at,
+              postgresql_where=text("generation_status = 'claimed'")),
+    )
+
     def __repr__(self):
         return f"<NewsItem(title='{self.title[:30]}...', source='{self.source}')>"
 
@@ -29,7 +67,8 @@ class NewsItem(Base):
             "summary": self.summary,
             "source": self.source,
             "published_at": self.published_at.isoformat(),
-            "raw_text": self.raw_text
+            "raw_text": self.raw_text,
+            "canonical_id": str(self.canonical_id) if self.canonical_id else None
         }
 
 
@@ -39,9 +78,24 @@ class Post(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     title = Column(String, nullable=False)
     content = Column(Text, nullable=False)
-    status = Column(String, default="draft")  # draft, published, failed
-    news_item_id = Column(UUID(as_uuid=True), ForeignKey("news_items.id"), nullable=False)
+    status = Column(String, default="draft")  # draft, publishing, published, failed
+    news_item_id = Column(UUID(as_uuid=True), ForeignKey("news_items.id"), nullable=False, index=True)
     created_at = Column(DateTime, default=datetime.now)
+    # Когда воркер забрал пост на публикацию (статус publishing)
+    publish_claimed_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # Keyset-пагинация /posts/ без фильтра и с фильтром по статусу.
+        # Индекс по статусу заодно обслуживает выборку черновиков на публикацию
+        Index("ix_posts_created_at_id", created_at, id),
+        Index("ix_posts_status_created_at_id", status, created_at, id),
+        # Поиск зависших публикаций
+        Index(
+            "ix_posts_publishing_claimed",
+            publish_claimed_at,
+            postgresql_where=text("status = 'publishing'")
+        ),
+    )
 
     def __repr__(self):
         return f"<Post(title='{self.title[:30]}...', status='{self.status}')>"
@@ -55,4 +109,32 @@ class NewsSource(Base):
     url = Column(String, nullable=False)
     is_active = Column(Boolean, default=True)
     parser_type = Column(String, nullable=False)
-    created_at = Column(DateTime, default=datetime.now)
\ No newline at end of file
+    created_at = Column(DateTime, default=datetime.now)
+
+    # Кэш условного GET для RSS
+    etag = Column(String, nullable=True)
+    last_modified = Column(String, nullable=True)
+    content_hash = Column(String(64), nullable=True)
+
+    # Последнее загруженное сообщение Telegram-канала
+    last_message_id = Column(Integer, nullable=True)
+
+
+class GenerationBatch(Base):
+    __tablename__ = "generation_batches"
+
+    id = Column(Integer, primary_key=True, index=True)
+    openai_batch_id = Column(String, unique=True, nullable=False)
+    status = Column(String, nullable=False, default="validating")  # статус батча в OpenAI
+    items_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.now)
+    completed_at = Column(DateTime, nullable=True)
+
+
+
+class StatCounter(Base):
+    """Счётчики для дашборда, обновляются при вставке и смене статуса"""
+    __tablename__ = "stat_counters"
+
+    name = Column(String, primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
@@ -0,0 +1,86 @@
+"""
+Нормализация текста новости при сборе: из описания RSS и текста Telegram-поста убирается HTML,
+служебные хвосты («Читать далее», «The post ... appeared first on ...») и ссылки, а результат
+обрезается по бюджету токенов. В БД и в промпт LLM попадает уже очищенный summary.
+"""
+import re
+import warnings
+
+from bs4 import BeautifulSoup, MarkupResemblesLocatorWarning
+
+from app.ai.rate_limit import estimate_tokens
+from app.config import settings
+
+# Теги, текст которых в пост не нужен: код, медиа, скрипты, формы
+DROP_TAGS = ("script", "style", "noscript", "iframe", "img", "picture", "video", "audio", "svg",
+             "pre", "form", "button", "figure")
+BLOCK_TAGS = ("p", "div", "br", "li", "ul", "ol", "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "tr", "table")
+
+_HTML_TAG = re.compile(r"<[a-zA-Z/!][^>]*>")
+_URL = re.compile(r"https?://\S+")
+_BOILERPLATE = [
+    re.compile(pattern, re.IGNORECASE)
+    for pattern in (
+        r"^(читать|смотреть) (далее|дальше|полностью|продолжение)\W*$",
+        r"^(подробнее|далее|источник|фото|иллюстрация)\s*(:.*)?$",
+        r"^(read|continue reading|read more|full story)\b.{0,40}$",
+        r"^the post .+ appeared first on .+$",
+        r"^запись .+ впервые появилась .+$",
+        r"^сообщение .+ появились сначала на .+$",
+        r"^(подписывайтесь|подпишись|подписаться)\b.{0,80}$",
+    )
+]
+_SENTENCE_END = re.compile(r"[.!?…](?=\s|$)")
+
+
+def strip_html(text: str) -> str:
+    """Текст без разметки; блочные элементы превращаются в переводы строк"""
+    if not _HTML_TAG.search(text):
+        return text
+    with warnings.catch_warnings():
+        # Короткий текст, похожий на путь или URL, — не повод для предупреждения
+        warnings.simplefilter("ignore", MarkupResemblesLocatorWarning)
+        soup = BeautifulSoup(text, "html.parser")
+    for tag in soup.find_all(DROP_TAGS):
+        tag.decompose()
+    for tag in soup.find_all(BLOCK_TAGS):
+        tag.insert_before("\n")
+        tag.insert_after("\n")
+    return soup.get_text()
+
+
+def remove_boilerplate(text: str) -> str:
+    """Убирает ссылки, служебные строки и лишние пробелы, сохраняя деление на абзацы"""
+    lines = []
+    for line in text.splitlines():
+        line = " ".join(_URL.sub(" ", line).split())
+        if line and not any(pattern.match(line) for pattern in _BOILERPLATE):
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def truncate_to_budget(text: str, max_tokens: int) -> str:
+    """
+    Обрезает текст до max_tokens по той же оценке, что и лимитер OpenAI (estimate_tokens),
+    по границе предложения, а если её нет близко — по границе слова.
+    """
+    if max_tokens <= 0 or estimate_tokens(text) <= max_tokens:
+        return text
+    # estimate_tokens: ~3 символа на токен; оставляем место под многоточие
+    limit = max(1, (max_tokens - 1) * 3 - 1)
+    cut = text[:limit]
+    sentence_ends = [match.end() for match in _SENTENCE_END.finditer(cut)]
+    if sentence_ends and sentence_ends[-1] >= limit // 2:
+        return cut[:sentence_ends[-1]]
+    space = cut.rfind(" ")
+    if space >= limit // 2:
+        cut = cut[:space]
+    return cut.rstrip(" ,;:—-") + "…"
+
+
+def clean_summary(text: str, max_tokens: int = None) -> str:
+    """HTML → текст → без служебных строк → в пределах бюджета токенов (SUMMARY_MAX_TOKENS)"""
+    if not text:
+        return ""
+    max_tokens = settings.SUMMARY_MAX_TOKENS if max_tokens is None else max_tokens
+    return truncate_to_budget(remove_boilerplate(strip_html(text)), max_tokens)
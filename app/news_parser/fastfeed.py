@@ -0,0 +1,126 @@
+"""
+Быстрый разбор RSS 2.0 / RSS 1.0 / Atom потоковым XML-парсером.
+
+Достаёт только то, что мы храним: заголовок, ссылку, описание и дату публикации,
+повторяя то, что для этих полей возвращает feedparser. Всё, что выходит за рамки
+простого случая (битый XML, кодировка из HTTP-заголовка расходится с объявленной,
+относительные ссылки, XHTML-содержимое, незнакомый формат даты), отдаётся feedparser:
+parse_feed_fast бросает FastFeedError, и вызывающий код переключается на полный разбор.
+"""
+import io
+import re
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional
+
+ATOM_NS = "http://www.w3.org/2005/Atom"
+CONTENT_NS = "http://purl.org/rss/1.0/modules/content/"
+FEED_ROOTS = {"rss", "RDF", "feed"}
+
+_XML_ENCODING = re.compile(rb"""^<\?xml[^>]*encoding=["']([A-Za-z0-9._-]+)["']""")
+_HEADER_CHARSET = re.compile(r"charset=[\"']?([A-Za-z0-9._-]+)", re.IGNORECASE)
+
+
+class FastFeedError(ValueError):
+    """Лента не подходит для быстрого разбора"""
+
+
+def _split_tag(tag: str) -> tuple:
+    if tag[0] == "{":
+        ns, _, local = tag[1:].partition("}")
+        return ns, local
+    return "", tag
+
+
+def _text(element: ET.Element) -> str:
+    if len(element):
+        # XHTML внутри title/summary/content: feedparser сериализует разметку, мы — нет
+        raise FastFeedError(f"markup inside <{element.tag}>")
+    return element.text or ""
+
+
+def _parse_date(value: str) -> datetime:
+    """Дата в UTC без часового пояса — как datetime(*entry.published_parsed[:6])"""
+    value = value.strip()
+    try:
+        parsed = parsedate_to_datetime(value)  # RFC 822 (RSS)
+    except (TypeError, ValueError):
+        try:
+            parsed = datetime.fromisoformat(value)  # RFC 3339 (Atom)
+        except ValueError:
+            raise FastFeedError(f"unsupported date {value!r}") from None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _check_encoding(content: bytes, response_headers: Optional[Dict]):
+    """Кодировку из HTTP-заголовка feedparser ставит выше объявленной в XML — такие случаи не берём"""
+    headers = {k.lower(): v for k, v in (response_headers or {}).items()}
+    header_charset = _HEADER_CHARSET.search(headers.get("content-type", ""))
+    if not header_charset:
+        return
+    declared = _XML_ENCODING.match(content.lstrip()[:200])
+    declared_name = declared.group(1).decode("ascii") if declared else "utf-8"
+    if header_charset.group(1).lower().replace("_", "-") != declared_name.lower().replace("_", "-"):
+        raise FastFeedError("charset in Content-Type differs from XML declaration")
+
+
+def _parse_entry(element: ET.Element) -> Dict:
+    title = link = summary = content = guid = published = None
+    for child in element:
+        ns, name = _split_tag(child.tag)
+        if name == "title":
+            title = _text(child)
+        elif name == "link":
+            if ns == ATOM_NS:
+                if link is None and child.get("rel", "alternate") == "alternate":
+                    link = child.get("href")
+            else:
+                link = _text(child)
+        elif name in ("description", "summary"):
+            summary = _text(child)
+        elif name == "content" and ns == ATOM_NS or name == "encoded" and ns == CONTENT_NS:
+            content = _text(child)
+        elif name == "guid" and child.get("isPermaLink", "true").lower() == "true":
+            guid = _text(child)
+        elif name in ("pubDate", "published", "issued") and published is None:
+            published = _parse_date(_text(child))
+
+    link = (link if link is not None else guid or "").strip()
+    if link and not link.startswith(("http://", "https://")):
+        # Относительные ссылки feedparser разрешает по адресу ленты
+        raise FastFeedError(f"relative link {link!r}")
+
+    return {
+        "title": (title or "").strip(),
+        "url": link,
+        # Как и feedparser, при отсутствии описания берём полный текст
+        "summary": summary if summary is not None else content or "",
+        "published_at": published,
+    }
+
+
+def parse_feed_fast(content: bytes, response_headers: Optional[Dict] = None) -> List[Dict]:
+    """
+    Разбирает ленту потоково: каждый <item>/<entry> обрабатывается и сразу освобождается.
+    Возвращает title, url, summary и published_at (None, если даты нет).
+    """
+    _check_encoding(content, response_headers)
+    items = []
+    root = None
+    try:
+        for event, element in ET.iterparse(io.BytesIO(content), events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = element
+                    if _split_tag(root.tag)[1] not in FEED_ROOTS:
+                        raise FastFeedError(f"unknown root <{root.tag}>")
+                continue
+            if _split_tag(element.tag)[1] in ("item", "entry"):
+                items.append(_parse_entry(element))
+                element.clear()
+    except ET.ParseError as e:
+        raise FastFeedError(f"malformed XML: {e}") from None
+    return items
@@ -0,0 +1,65 @@
+import hashlib
+import re
+from typing import List, Optional
+
+from app.config import settings
+
+SIMHASH_BITS = 64
+# Короткие тексты дают случайные совпадения, их не сравниваем
+MIN_TOKENS = 8
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _tokens(text: str) -> List[str]:
+    # Однобуквенные предлоги и союзы только добавляют шум
+    return [token for token in _TOKEN_RE.findall(_TAG_RE.sub(" ", text).lower()) if len(token) > 1]
+
+
+def _hash64(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(text: str) -> Optional[int]:
+    """
+    SimHash текста по словам: перестановки и правка пары слов меняют лишь несколько битов.
+    Возвращает знаковое 64-битное число (под BIGINT) или None для слишком короткого текста.
+    """
+    tokens = _tokens(text or "")
+    if len(tokens) < MIN_TOKENS:
+        return None
+
+    weights = [0] * SIMHASH_BITS
+    for token in tokens:
+        h = _hash64(token)
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if h >> bit & 1 else -1
+
+    value = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            value |= 1 << bit
+    return value - (1 << SIMHASH_BITS) if value >= 1 << (SIMHASH_BITS - 1) else value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin((a ^ b) & ((1 << SIMHASH_BITS) - 1)).count("1")
+
+
+def lsh_bands(fingerprint: int) -> List[int]:
+    """
+    Режет отпечаток на полосы для LSH-индекса.
+    Полос на одну больше допустимого расстояния Хэмминга, поэтому у близких
+    отпечатков хотя бы одна полоса совпадает. Номер полосы кодируется в старших
+    битах, чтобы одинаковые значения разных полос не пересекались.
+    """
+    count = max(4, settings.NEAR_DUPLICATE_MAX_DISTANCE + 1)
+    width = SIMHASH_BITS // count
+    unsigned = fingerprint & ((1 << SIMHASH_BITS) - 1)
+    bands = []
+    for i in range(count):
+        # Последняя полоса забирает остаток битов
+        bits = width if i < count - 1 else SIMHASH_BITS - width * (count - 1)
+        bands.append(i << 16 | (unsigned >> (i * width)) & ((1 << bits) - 1))
+    return bands
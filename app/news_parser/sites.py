@@ -1,52 +1,185 @@
 import feedparser
+import hashlib
+import httpx
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
+from urllib.parse import urlsplit
 import logging
 from sqlalchemy.orm import Session
+from app.config import settings
+from app.metrics import FEED_FETCH_SECONDS
 from app.models import NewsSource
+from app.news_parser.cleaning import clean_summary
+from app.news_parser.fastfeed import FastFeedError, parse_feed_fast
 
 logger = logging.getLogger(__name__)
 
 
 class NewsParser:
     def __init__(self, db: Session):
+        self.db = db
         # Получаем только активные RSS/сайтовые источники
-        self.sources = {
-            source.name: source.url
-            for source in db.query(NewsSource)
-            .filter(
-                NewsSource.is_active == True,
-                NewsSource.parser_type != "telegram"
-            ).all()
+        sources = db.query(NewsSource).filter(
+            NewsSource.is_active == True,
+            NewsSource.parser_type != "telegram"
+        ).all()
+        self.sources = {source.name: source.url for source in sources}
+        # Валидаторы для условного GET: то, что вернул сервер в прошлый раз
+        self.cache = {
+            source.name: {
+                "etag": source.etag,
+                "last_modified": source.last_modified,
+                "content_hash": source.content_hash,
+            }
+            for source in sources
         }
+        self.source_ids = {source.name: source.id for source in sources}
+        # Новые валидаторы, которые сохраняются после записи новостей в БД
+        self.fetch_state = {}
 
     def parse_all(self) -> List[Dict]:
-        all_news = []
+        """
+        Параллельно забирает все ленты.
+        Общее число одновременных загрузок ограничено FEED_FETCH_CONCURRENCY,
+        число загрузок с одного хоста — FEED_FETCH_PER_HOST.
+        """
+        # Очереди источников по хостам: следующий источник хоста запускается,
+        # только когда освобождается слот этого хоста
+        queues = defaultdict(deque)
         for source, url in self.sources.items():
-            try:
-                news = self._parse_feed(source, url)
-                all_news.extend(news)
-                logger.info(f"Fetched {len(news)} items from {source}")
-            except Exception as e:
-                logger.error(f"Failed to parse {source}: {e}")
+            queues[urlsplit(url).netloc.lower()].append((source, url))
+
+        results = {}
+        http_client = httpx.Client(
+            headers={"User-Agent": feedparser.USER_AGENT},
+            timeout=settings.FEED_FETCH_TIMEOUT,
+            follow_redirects=True,
+        )
+        with http_client, ThreadPoolExecutor(max_workers=max(1, settings.FEED_FETCH_CONCURRENCY)) as pool:
+            running = {}
+
+            def submit_next(host: str):
+                source, url = queues[host].popleft()
+                future = pool.submit(self._fetch_feed, http_client, source, url, self.cache.get(source, {}))
+                running[future] = (host, source)
+
+            for host, queue in queues.items():
+                for _ in range(min(len(queue), max(1, settings.FEED_FETCH_PER_HOST))):
+                    submit_next(host)
+
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    host, source = running.pop(future)
+                    try:
+                        news, state = future.result()
+                        if state:
+                            self.fetch_state[source] = state
+                        if news is None:
+                            logger.info(f"Feed {source} not modified, skipped")
+                        else:
+                            results[source] = news
+                            logger.info(f"Fetched {len(news)} items from {source}")
+                    except Exception as e:
+                        logger.error(f"Failed to parse {source}: {e}")
+                    if queues[host]:
+                        submit_next(host)
+
+        # Сохраняем исходный порядок источников
+        all_news = []
+        for source in self.sources:
+            all_news.extend(results.get(source, []))
         return all_news
 
+    def save_fetch_state(self):
+        """
+        Сохраняет ETag, Last-Modified и хэш ленты у источников.
+        Вызывается после сохранения новостей, чтобы при ошибке записи
+        лента не считалась уже обработанной.
+        """
+        for source, state in self.fetch_state.items():
+            self.db.query(NewsSource).filter(NewsSource.id == self.source_ids[source]).update(state)
+        self.db.commit()
+        self.fetch_state = {}
+
+    @classmethod
+    def _fetch_feed(cls, http_client: httpx.Client, source: str, feed_url: str,
+                    cache: Dict) -> Tuple[Optional[List[Dict]], Optional[Dict]]:
+        """
+        Загружает ленту условным GET.
+        Возвращает (None, state), если лента не изменилась (304 или тот же хэш).
+        """
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            items, state = cls._fetch_feed_conditional(http_client, source, feed_url, cache)
+            outcome = "not_modified" if items is None else "ok"
+            return items, state
+        finally:
+            FEED_FETCH_SECONDS.labels("rss", source, outcome).observe(time.perf_counter() - started)
+
+    @classmethod
+    def _fetch_feed_conditional(cls, http_client: httpx.Client, source: str, feed_url: str,
+                                cache: Dict) -> Tuple[Optional[List[Dict]], Optional[Dict]]:
+        headers = {}
+        if cache.get("etag"):
+            headers["If-None-Match"] = cache["etag"]
+        if cache.get("last_modified"):
+            headers["If-Modified-Since"] = cache["last_modified"]
+
+        response = http_client.get(feed_url, headers=headers)
+        if response.status_code == 304:
+            return None, None
+        response.raise_for_status()
+
+        state = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "content_hash": hashlib.sha256(response.content).hexdigest(),
+        }
+        if state["content_hash"] == cache.get("content_hash"):
+            return None, state
+
+        return cls._parse_feed(source, response.content, dict(response.headers)), state
+
+    @classmethod
+    def _parse_feed(cls, source: str, content: bytes, response_headers: Optional[Dict] = None) -> List[Dict]:
+        entries = None
+        if settings.FEED_FAST_PARSER:
+            try:
+                entries = parse_feed_fast(content, response_headers)
+            except FastFeedError as e:
+                logger.debug(f"Feed {source} falls back to feedparser: {e}")
+        if entries is None:
+            entries = cls._parse_with_feedparser(content, response_headers)
+
+        return [
+            {
+                **entry,
+                # Если от описания ничего не осталось (например, только картинка), LLM получит заголовок
+                "summary": clean_summary(entry["summary"]) or entry["title"],
+                "source": source,
+                "published_at": entry["published_at"] or datetime.now(),
+            }
+            for entry in entries
+        ]
+
     @staticmethod
-    def _parse_feed(source: str, feed_url: str) -> List[Dict]:
-        feed = feedparser.parse(feed_url)
+    def _parse_with_feedparser(content: bytes, response_headers: Optional[Dict] = None) -> List[Dict]:
+        feed = feedparser.parse(content, response_headers=response_headers)
         items = []
         for entry in feed.entries:
             published_at = None
             if hasattr(entry, 'published_parsed') and entry.published_parsed:
                 published_at = datetime(*entry.published_parsed[:6])
-            else:
-                published_at = datetime.now()
 
             items.append({
                 "title": entry.get("title", "").strip(),
                 "url": entry.get("link", "").strip(),
                 "summary": entry.get("summary", entry.get("description", "")),
-                "source": source,
                 "published_at": published_at
             })
         return items
@@ -1,32 +1,60 @@
 import asyncio
+import time
 from telethon import TelegramClient
-from telethon.errors import ChannelInvalidError
+from telethon.errors import ChannelInvalidError, FloodWaitError
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Optional
 from app.models import NewsSource
 from sqlalchemy.orm import Session
 import logging
 
 from app.config import settings
+from app.metrics import FEED_FETCH_SECONDS
+from app.news_parser.cleaning import clean_summary
 
 logger = logging.getLogger(__name__)
 
 
+def channel_name(source_url: str) -> str:
+    return source_url.lstrip("@")  # Убираем @ если есть
+
+
+def message_to_news(channel: str, msg) -> Optional[Dict]:
+    """Новость из сообщения канала; None для сообщений без текста"""
+    if not msg.text or not msg.text.strip():
+        return None
+    title = TelegramNewsParser._extract_title(msg.text)
+    return {
+        "title": title,
+        "url": f"https://t.me/{channel}/{msg.id}",
+        # raw_text — без markdown-разметки, которую Telethon добавляет в msg.text
+        "summary": clean_summary(msg.raw_text) or title,
+        "source": f"t.me/{channel}",
+        "published_at": msg.date or datetime.utcnow(),
+        "raw_text": msg.text
+    }
+
+
 class TelegramNewsParser:
     def __init__(self, db: Session):
+        self.db = db
         self.client = TelegramClient(
             settings.TELEGRAM_SESSION_NAME,
             settings.TELEGRAM_API_ID,
             settings.TELEGRAM_API_HASH
         )
-        self.channels = [
-            source.url.lstrip("@")  # Убираем @ если есть
-            for source in db.query(NewsSource)
-            .filter(
-                NewsSource.is_active == True,
-                NewsSource.parser_type == "telegram"
-            ).all()
-        ]
+        sources = db.query(NewsSource).filter(
+            NewsSource.is_active == True,
+            NewsSource.parser_type == "telegram"
+        ).all()
+        self.channels = [channel_name(source.url) for source in sources]
+        self.source_ids = {channel_name(source.url): source.id for source in sources}
+        # Последний обработанный id сообщения по каналу
+        self.watermarks = {channel_name(source.url): source.last_message_id for source in sources}
+        # Новые водяные знаки, которые сохраняются после записи новостей в БД
+        self.fetch_state = {}
+        # До какого момента (time.monotonic) Telegram просил не слать запросы
+        self._flood_until = 0.0
 
     async def _ensure_authorized(self):
         """Автоматическое подключение с проверкой авторизации"""
@@ -41,42 +69,83 @@ class TelegramNewsParser:
     async def parse_all(self) -> List[Dict]:
         await self._ensure_authorized()
 
-        all_news = []
-        try:
-            for channel in self.channels:
+        semaphore = asyncio.Semaphore(max(1, settings.TELEGRAM_FETCH_CONCURRENCY))
+
+        async def fetch(channel: str) -> List[Dict]:
+            async with semaphore:
+                started = time.perf_counter()
+                outcome = "error"
                 try:
-                    news = await self._parse_channel(channel)
-                    all_news.extend(news)
+                    news = await self._parse_channel_with_flood_wait(channel)
+                    outcome = "ok"
                     logger.info(f"Fetched {len(news)} items from Telegram channel @{channel}")
+                    return news
                 except ChannelInvalidError:
                     logger.warning(f"Channel @{channel} not found or private")
                 except Exception as e:
                     logger.error(f"Error parsing @{channel}: {e}")
+                finally:
+                    FEED_FETCH_SECONDS.labels("telegram", channel, outcome).observe(time.perf_counter() - started)
+                return []
+
+        try:
+            results = await asyncio.gather(*(fetch(channel) for channel in self.channels))
         finally:
             await self.client.disconnect()  # type: ignore
 
-        return all_news
+        return [item for news in results for item in news]
+
+    async def _parse_channel_with_flood_wait(self, channel: str) -> List[Dict]:
+        """
+        Короткие FloodWait Telethon пережидает сам (flood_sleep_threshold).
+        На длинный FloodWait приостанавливаются все каналы, а этот повторяется.
+        """
+        for attempt in range(settings.TELEGRAM_FLOOD_RETRIES + 1):
+            delay = self._flood_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                return await self._parse_channel(channel)
+            except FloodWaitError as e:
+                if attempt == settings.TELEGRAM_FLOOD_RETRIES:
+                    raise
+                logger.warning(f"FloodWait {e.seconds}s on @{channel}, pausing Telegram fetches")
+                self._flood_until = max(self._flood_until, time.monotonic() + e.seconds)
+        return []
 
     async def _parse_channel(self, channel: str) -> List[Dict]:
-        messages = await self.client.get_messages(channel, limit=15)
+        min_id = self.watermarks.get(channel)
+        if min_id:
+            # Всё новое после водяного знака, от старых к новым: если упрёмся в лимит,
+            # следующий запуск продолжит с того же места и ничего не потеряет
+            messages = self.client.iter_messages(
+                channel, min_id=min_id, reverse=True, limit=settings.TELEGRAM_FETCH_MAX_MESSAGES
+            )
+        else:
+            # Первый запуск для канала — только последние сообщения
+            messages = self.client.iter_messages(channel, limit=settings.TELEGRAM_INITIAL_FETCH_LIMIT)
+
         items = []
-        for msg in messages:
-            if not msg.text or not msg.text.strip():
-                continue
-
-            url = f"https://t.me/{channel}/{msg.id}"
-            summary = msg.text[:2000]
-
-            items.append({
-                "title": self._extract_title(msg.text),
-                "url": url,
-                "summary": summary,
-                "source": f"t.me/{channel}",
-                "published_at": msg.date or datetime.utcnow(),
-                "raw_text": msg.text
-            })
+        max_id = min_id or 0
+        async for msg in messages:
+            max_id = max(max_id, msg.id)
+            item = message_to_news(channel, msg)
+            if item:
+                items.append(item)
+
+        if max_id and max_id != min_id:
+            self.fetch_state[channel] = max_id
         return items
 
+    def save_fetch_state(self):
+        """Сохраняет водяные знаки каналов. Вызывается после записи новостей в БД"""
+        for channel, last_message_id in self.fetch_state.items():
+            self.db.query(NewsSource).filter(NewsSource.id == self.source_ids[channel]).update(
+                {"last_message_id": last_message_id}
+            )
+        self.db.commit()
+        self.fetch_state = {}
+
     @staticmethod
     def _extract_title(text: str) -> str:
         lines = [line.strip() for line in text.split('\n') if line.strip()]
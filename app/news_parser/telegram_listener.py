@@ -0,0 +1,167 @@
+"""
+Push-сбор новостей из Telegram: долгоживущий клиент Telethon слушает events.NewMessage
+в каналах из NewsSource (parser_type == "telegram") и пишет новости в БД пачками,
+сразу ставя их генерацию.
+
+Список каналов перечитывается из БД каждые TELEGRAM_LISTENER_REFRESH_INTERVAL секунд,
+поэтому добавление и /sources/{id}/toggle подхватываются без перезапуска.
+Обновления приходят только из каналов, на которые подписан аккаунт
+(TELEGRAM_LISTENER_JOIN_CHANNELS=true — подписываться автоматически).
+
+Водяные знаки каналов (last_message_id) слушатель не двигает: периодическая задача
+fetch_news_from_telegram по-прежнему добирает всё, что слушатель пропустил,
+а уже сохранённые сообщения отсекаются по URL.
+
+Запуск:
+    uv run python -m app.news_parser.telegram_listener
+"""
+import asyncio
+import logging
+from typing import Dict, List
+
+from telethon import TelegramClient, events
+from telethon.tl.functions.channels import JoinChannelRequest
+
+from app.api import crud
+from app.config import settings
+from app.database import SessionLocal
+from app.logging_config import setup_logging
+from app.metrics import record_fetched_news
+from app.models import NewsSource
+from app.news_parser.telegram import channel_name, message_to_news
+
+logger = logging.getLogger(__name__)
+
+
+class TelegramNewsListener:
+    def __init__(self):
+        self.client = TelegramClient(
+            settings.TELEGRAM_LISTENER_SESSION_NAME,
+            settings.TELEGRAM_API_ID,
+            settings.TELEGRAM_API_HASH
+        )
+        # peer id канала -> имя канала; только активные источники
+        self.channels: Dict[int, str] = {}
+        # Кэш разрешённых имён: ResolveUsername у Telegram строго лимитирован
+        self._peer_ids: Dict[str, int] = {}
+        self._pending: List[Dict] = []
+        self._flush_now = asyncio.Event()
+
+    def _load_channels(self) -> List[str]:
+        db = SessionLocal()
+        try:
+            sources = db.query(NewsSource.url).filter(
+                NewsSource.is_active == True,
+                NewsSource.parser_type == "telegram"
+            ).all()
+            return [channel_name(source.url) for source in sources]
+        finally:
+            db.close()
+
+    async def refresh_channels(self):
+        """Сверяет список слушаемых каналов с таблицей источников"""
+        names = await asyncio.to_thread(self._load_channels)
+        channels = {}
+        for name in names:
+            peer_id = self._peer_ids.get(name)
+            if peer_id is None:
+                try:
+                    peer_id = await self.client.get_peer_id(name)
+                    if settings.TELEGRAM_LISTENER_JOIN_CHANNELS:
+                        await self.client(JoinChannelRequest(name))
+                except Exception as e:
+                    # Попробуем ещё раз при следующем обновлении списка
+                    logger.warning(f"Cannot subscribe to Telegram channel @{name}: {e}")
+                    continue
+                self._peer_ids[name] = peer_id
+            channels[peer_id] = name
+
+        added = set(channels.values()) - set(self.channels.values())
+        removed = set(self.channels.values()) - set(channels.values())
+        if added or removed:
+            logger.info(f"Telegram listener channels: +{sorted(added)} -{sorted(removed)}")
+        self.channels = channels
+
+    async def _on_message(self, event):
+        channel = self.channels.get(event.chat_id)
+        if channel is None:
+            return
+        item = message_to_news(channel, event.message)
+        if item is None:
+            return
+        self._pending.append(item)
+        if len(self._pending) >= settings.TELEGRAM_LISTENER_BATCH_SIZE:
+            self._flush_now.set()
+
+    def _save(self, items: List[Dict]) -> int:
+        db = SessionLocal()
+        try:
+            inserted = crud.bulk_create_news_items(db, items)
+        finally:
+            db.close()
+        record_fetched_news("telegram_listener", len(items), len(inserted))
+        # Импорт здесь: app.tasks тянет за собой Celery-приложение
+        from app.tasks import enqueue_generation
+        enqueue_generation(inserted)
+        return len(inserted)
+
+    async def flush(self):
+        if not self._pending:
+            return
+        items, self._pending = self._pending, []
+        try:
+            inserted = await asyncio.to_thread(self._save, items)
+            logger.info(f"✅ Сохранено {inserted} из {len(items)} новостей из Telegram (push)")
+        except Exception as e:
+            # Потерянное доберёт периодический сбор: водяные знаки каналов не сдвигались
+            logger.error(f"Failed to save {len(items)} Telegram messages: {e}")
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), settings.TELEGRAM_LISTENER_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self.flush()
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(settings.TELEGRAM_LISTENER_REFRESH_INTERVAL)
+            try:
+                await self.refresh_channels()
+            except Exception as e:
+                logger.error(f"Failed to refresh Telegram listener channels: {e}")
+
+    async def run(self):
+        await self.client.connect()
+        if not await self.client.is_user_authorized():
+            await self.client.disconnect()
+            raise RuntimeError(
+                f"Telegram session {settings.TELEGRAM_LISTENER_SESSION_NAME} not authorized. "
+                "Please run: python -m app.telegram.auth --listener"
+            )
+
+        await self.refresh_channels()
+        self.client.add_event_handler(self._on_message, events.NewMessage())
+        background = [asyncio.create_task(self._flush_loop()), asyncio.create_task(self._refresh_loop())]
+        logger.info(f"Telegram listener started for {len(self.channels)} channels")
+        try:
+            # Обновления, пропущенные пока клиент был отключён
+            await self.client.catch_up()
+            await self.client.run_until_disconnected()
+        finally:
+            for task in background:
+                task.cancel()
+            await self.flush()
+            await self.client.disconnect()
+
+
+async def main():
+    # Клиент Telethon создаётся внутри работающего event loop
+    await TelegramNewsListener().run()
+
+
+if __name__ == "__main__":
+    setup_logging()
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+"""
+Профилирование задач Celery и HTTP-запросов по запросу.
+
+Включается PROFILING_ENABLED=true; PROFILING_SAMPLE_RATE задаёт долю профилируемых запусков.
+На каждый запуск в PROFILING_DIR пишутся два файла: .pstats (для pstats / snakeviz)
+и .txt с топом функций по cumulative time. Хранятся последние PROFILING_KEEP запусков.
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import re
+from datetime import datetime
+from typing import Optional
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SUFFIXES = (".pstats", ".txt")
+# Сколько строк топа попадает в текстовую сводку
+SUMMARY_LINES = 60
+
+
+def should_profile() -> bool:
+    return settings.PROFILING_ENABLED and random.random() < settings.PROFILING_SAMPLE_RATE
+
+
+def start_profiler() -> Optional[cProfile.Profile]:
+    """
+    Запускает профилировщик для текущего потока, если этот запуск попал в выборку.
+    Возвращает None, если профилировать не нужно или в потоке уже работает другой профилировщик
+    (например, параллельный запрос в том же event loop).
+    """
+    if not should_profile():
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return None
+    return profiler
+
+
+def stop_profiler(profiler: Optional[cProfile.Profile], kind: str, name: str, duration: float) -> Optional[str]:
+    """Останавливает профилировщик и сохраняет результат; возвращает базовое имя файлов"""
+    if profiler is None:
+        return None
+    profiler.disable()
+    try:
+        return _save_profile(profiler, kind, name, duration)
+    except OSError as e:
+        logger.warning(f"Failed to save profile for {kind} {name}: {e}")
+        return None
+
+
+def _save_profile(profiler: cProfile.Profile, kind: str, name: str, duration: float) -> str:
+    os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+    safe_name = re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_") or "root"
+    base = f"{datetime.now():%Y%m%d-%H%M%S-%f}_{kind}_{safe_name}_{os.getpid()}"
+    path = os.path.join(settings.PROFILING_DIR, base)
+
+    profiler.dump_stats(path + ".pstats")
+    summary = io.StringIO()
+    summary.write(f"{kind} {name}: {duration * 1000:.1f} ms\n\n")
+    pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(SUMMARY_LINES)
+    with open(path + ".txt", "w", encoding="utf-8") as f:
+        f.write(summary.getvalue())
+
+    _prune_profiles()
+    return base
+
+
+def _prune_profiles():
+    """Оставляет только последние PROFILING_KEEP запусков"""
+    for base in list_profiles()[settings.PROFILING_KEEP:]:
+        for suffix in PROFILE_SUFFIXES:
+            try:
+                os.remove(os.path.join(settings.PROFILING_DIR, base["name"] + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles() -> list[dict]:
+    """Сохранённые запуски от новых к старым (имя начинается с времени запуска)"""
+    try:
+        files = os.listdir(settings.PROFILING_DIR)
+    except FileNotFoundError:
+        return []
+    names = sorted((f.removesuffix(".pstats") for f in files if f.endswith(".pstats")), reverse=True)
+    # Имя: <время>_<task|http>_<задача или маршрут>_<pid>
+    return [{"name": name, "kind": name.split("_")[1] if "_" in name else ""} for name in names]
+
+
+def profile_path(name: str, suffix: str) -> Optional[str]:
+    """Путь к файлу сохранённого запуска; None, если такого нет (имя проверяется по списку)"""
+    if suffix not in PROFILE_SUFFIXES or name not in {p["name"] for p in list_profiles()}:
+        return None
+    return os.path.join(settings.PROFILING_DIR, name + suffix)
@@ -3,34 +3,46 @@ from app.api import crud
 from app.news_parser.sites import NewsParser
 from app.news_parser.telegram import TelegramNewsParser
 from app.database import SessionLocal
-from app.ai.generator import generate_post_from_news
-from app.models import NewsItem, Post, NewsSource
-from telethon import TelegramClient
+from app.ai.batch import FINAL_STATUSES as FINAL_BATCH_STATUSES, submit_batch, retrieve_batch, download_batch_results
+from app.ai.generator import generate_posts_concurrently, cache_get, cache_set, news_cache_key
+from app.ai.rate_limit import RateLimiter
+from app.models import NewsItem, Post, NewsSource, GenerationBatch
+from datetime import datetime
+from app.telegram.publisher import PublishTimeoutError, get_publisher
 from app.config import settings
+from app.metrics import PUBLISH_FAILURES, PUBLISH_SECONDS, record_fetched_news
 import logging
 import asyncio
+import time
+import uuid
 
 logger = logging.getLogger(__name__)
 
+# Event loop процесса-воркера: создаётся лениво уже после fork и живёт между задачами,
+# чтобы соединения общего AsyncOpenAI-клиента не оказывались привязаны к закрытому loop
+_loop = None
+# Лимиты LLM процесса-воркера: общие для всех пачек и задач, иначе каждая пачка
+# начинала бы с полного ведра и RPM/TPM не соблюдались бы на длинной очереди
+_llm_semaphore = None
+_rate_limiter = None
 
-def _save_news_items(news_items: list):
-    db = SessionLocal()
-    added = 0
-    try:
-        for item in news_items:
-            existing = db.query(NewsItem).filter(NewsItem.url == item["url"]).first()
-            if not existing:
-                db_item = NewsItem(**item)
-                db.add(db_item)
-                added += 1
-        db.commit()
-        logger.info(f"Добавлено {added} новых новостей в БД")
-    except Exception as e:
-        db.rollback()
-        logger.error(f"Ошибка сохранения новости: {e}")
-    finally:
-        db.close()
-    return added
+
+def _run_async(coro):
+    global _loop, _llm_semaphore, _rate_limiter
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+        # Примитивы asyncio привязаны к loop, поэтому создаются заново вместе с ним
+        _llm_semaphore = _rate_limiter = None
+    return _loop.run_until_complete(coro)
+
+
+def _llm_limits() -> tuple:
+    """Семафор LLM_CONCURRENCY и RPM/TPM-лимитер текущего процесса"""
+    global _llm_semaphore, _rate_limiter
+    if _rate_limiter is None:
+        _llm_semaphore = asyncio.Semaphore(max(1, settings.LLM_CONCURRENCY))
+        _rate_limiter = RateLimiter(settings.LLM_REQUESTS_PER_MINUTE, settings.LLM_TOKENS_PER_MINUTE)
+    return _llm_semaphore, _rate_limiter
 
 
 @celery_app.task
@@ -41,11 +53,13 @@ def fetch_news_from_sites():
         news_items = parser.parse_all()
 
         # Сохраняем в БД
-        for item in news_items:
-            crud.create_news_item_if_not_exists(db, item)
+        inserted = crud.bulk_create_news_items(db, news_items)
+        parser.save_fetch_state()
+        record_fetched_news("rss", len(news_items), len(inserted))
+        enqueue_generation(inserted)
 
-        logger.info(f"✅ Сохранено {len(news_items)} новостей из сайтов")
-        return {"fetched": len(news_items)}
+        logger.info(f"✅ Сохранено {len(inserted)} из {len(news_items)} новостей из сайтов")
+        return {"fetched": len(news_items), "inserted": len(inserted)}
     finally:
         db.close()
 
@@ -58,95 +72,268 @@ def fetch_news_from_telegram():
         news_items = asyncio.run(parser.parse_all())
 
         # Сохраняем в БД
-        for item in news_items:
-            crud.create_news_item_if_not_exists(db, item)
+        inserted = crud.bulk_create_news_items(db, news_items)
+        parser.save_fetch_state()
+        record_fetched_news("telegram", len(news_items), len(inserted))
+        enqueue_generation(inserted)
 
-        logger.info(f"✅ Сохранено {len(news_items)} новостей из Telegram")
-        return {"fetched": len(news_items)}
+        logger.info(f"✅ Сохранено {len(inserted)} из {len(news_items)} новостей из Telegram")
+        return {"fetched": len(news_items), "inserted": len(inserted)}
     finally:
         db.close()
 
 
+def enqueue_generation(news_ids: list):
+    """Сразу ставит генерацию только что сохранённых новостей, не дожидаясь beat"""
+    if not news_ids or not settings.PIPELINE_CHAINING or settings.GENERATION_MODE != "realtime":
+        return
+    generate_posts_for_news.delay([str(news_id) for news_id in news_ids])
+
+
+def _enqueue_publishing(created: int):
+    """После генерации сразу ставит публикацию новых черновиков"""
+    if created and settings.PIPELINE_CHAINING:
+        publish_posts_to_telegram.delay()
+
+
 @celery_app.task
 def generate_posts_for_unprocessed_news():
-    """Генерирует посты для всех непроцессированных новостей"""
+    """
+    Генерирует посты для всех непроцессированных новостей.
+    При PIPELINE_CHAINING новости обычно уже обработаны цепочкой от сбора,
+    и beat-задача остаётся страховкой для пропущенных и возвращённых в очередь.
+    """
+    if settings.GENERATION_MODE == "batch":
+        return _run_async(_generate_posts_via_batch_api())
+
     db = SessionLocal()
     try:
-        # Находим новости без постов
-        news_items = db.query(NewsItem).outerjoin(Post).filter(Post.id.is_(None)).all()
+        crud.requeue_stale_generation_claims(db, settings.GENERATION_CLAIM_TIMEOUT)
+    finally:
+        db.close()
+    return _generate_posts_realtime()
 
-        for news in news_items:
-            try:
-                # Генерируем пост
-                result = asyncio.run(generate_post_from_news(news.summary))
-
-                # Сохраняем в БД
-                post = Post(
-                    title=result["title"],
-                    content=result["content"],
-                    news_item_id=news.id
-                )
-                db.add(post)
-                db.commit()
-                logger.info(f"Создан пост для новости: {news.title[:50]}...")
 
-            except Exception as e:
-                logger.error(f"Не удалось сгенерировать пост для новости {news.id}: {e}")
-                # Можно пометить как failed, но пока просто пропускаем
+@celery_app.task
+def generate_posts_for_news(news_ids: list[str]):
+    """Генерирует посты только для переданных новостей (ставится задачами сбора)"""
+    return _generate_posts_realtime([uuid.UUID(news_id) for news_id in news_ids])
 
+
+def _generate_posts_realtime(news_ids: list = None) -> dict:
+    db = SessionLocal()
+    processed = created = 0
+    failed = []
+    try:
+        # Забираем новости небольшими пачками: несколько воркеров могут работать параллельно
+        while True:
+            claimed = crud.claim_news_for_generation(db, settings.GENERATION_CLAIM_BATCH_SIZE, news_ids=news_ids)
+            if not claimed:
+                break
+            news_items = [news for news in claimed if news.generation_status == "claimed"]
+            processed += len(news_items)
+            batch_created, batch_failed = _run_async(_generate_posts(db, news_items))
+            created += batch_created
+            failed.extend(batch_failed)
+    finally:
+        # Неудачные возвращаем в очередь в конце запуска, чтобы не крутить их повторно в этом же цикле
+        try:
+            crud.release_news_claims(db, failed)
+        finally:
+            db.close()
+
+    _enqueue_publishing(created)
+    return {"processed": processed, "created": created, "failed": len(failed)}
+
+
+async def _generate_posts(db, news_items) -> tuple:
+    """
+    Генерирует посты параллельно в одном event loop и пишет их в БД пачками.
+    Возвращает (число созданных постов, id новостей, для которых пост не сохранён).
+    """
+    pending = []
+    failed = []
+    created = 0
+
+    def flush():
+        nonlocal created
+        if not pending:
+            return
+        try:
+            created += crud.bulk_create_posts(db, pending)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Не удалось сохранить {len(pending)} постов: {e}")
+            failed.extend(row["news_item_id"] for row in pending)
+        pending.clear()
+
+    semaphore, rate_limiter = _llm_limits()
+    async for index, result in generate_posts_concurrently(
+            [news.summary for news in news_items], semaphore, rate_limiter
+    ):
+        news = news_items[index]
+        if isinstance(result, Exception):
+            logger.error(f"Не удалось сгенерировать пост для новости {news.id}: {result}")
+            failed.append(news.id)
+            continue
+
+        pending.append({"title": result["title"], "content": result["content"], "news_item_id": news.id})
+        logger.info(f"Создан пост для новости: {news.title[:50]}...")
+        if len(pending) >= settings.POSTS_INSERT_BATCH_SIZE:
+            flush()
+
+    flush()
+    return created, failed
+
+
+async def _generate_posts_via_batch_api() -> dict:
+    """
+    Офлайн-генерация через OpenAI Batch API за один тик beat:
+    сначала забирает результаты завершённых батчей, затем отправляет новый.
+    """
+    db = SessionLocal()
+    created = 0
+    try:
+        active_batches = (
+            db.query(GenerationBatch)
+            .filter(GenerationBatch.status.notin_(FINAL_BATCH_STATUSES))
+            .all()
+        )
+        for batch in active_batches:
+            remote = await retrieve_batch(batch.openai_batch_id)
+            batch.status = remote.status
+            if remote.status in FINAL_BATCH_STATUSES:
+                # У просроченного батча тоже может быть частичный результат
+                results = await download_batch_results(remote)
+                created += _save_batch_results(db, batch, results)
+                logger.info(f"Батч {batch.openai_batch_id} завершён ({remote.status}): {len(results)} ответов")
+            db.commit()
+
+        claimed = crud.claim_news_for_generation(db, settings.GENERATION_BATCH_MAX_ITEMS, claim_status="batched")
+        news_items = [news for news in claimed if news.generation_status == "batched"]
+
+        # Что уже есть в кэше, сохраняем сразу, без батча
+        rows, to_submit = [], []
+        for news in news_items:
+            cached = cache_get(news_cache_key(news.summary))
+            if cached:
+                rows.append({"title": cached["title"], "content": cached["content"], "news_item_id": news.id})
+            else:
+                to_submit.append(news)
+        created += crud.bulk_create_posts(db, rows)
+        _enqueue_publishing(created)
+
+        submitted = 0
+        if to_submit:
+            try:
+                remote = await submit_batch([(str(news.id), news.summary) for news in to_submit])
+            except Exception:
+                # Батч не ушёл целиком — это не вина самих новостей
+                crud.release_news_claims(db, [news.id for news in to_submit], count_attempt=False)
+                raise
+            batch = GenerationBatch(openai_batch_id=remote.id, status=remote.status, items_count=len(to_submit))
+            db.add(batch)
+            db.flush()
+            db.query(NewsItem).filter(NewsItem.id.in_([news.id for news in to_submit])).update(
+                {"generation_batch_id": batch.id}, synchronize_session=False
+            )
+            db.commit()
+            submitted = len(to_submit)
+            logger.info(f"Отправлен батч {remote.id} на {submitted} новостей")
     finally:
         db.close()
 
-    return {"processed": len(news_items)}
+    return {"created": created, "submitted": submitted}
+
+
+def _save_batch_results(db, batch: GenerationBatch, results: dict) -> int:
+    """Пишет посты из результатов батча; новости без ответа возвращаются в очередь"""
+    news_ids = {
+        str(news_id): summary
+        for news_id, summary in db.query(NewsItem.id, NewsItem.summary)
+        .filter(NewsItem.generation_batch_id == batch.id)
+    }
+    rows = []
+    for custom_id, result in results.items():
+        if custom_id not in news_ids:
+            continue
+        if isinstance(result, dict):
+            rows.append({"title": result["title"], "content": result["content"], "news_item_id": uuid.UUID(custom_id)})
+            cache_set(news_cache_key(news_ids[custom_id]), result)
+        else:
+            logger.error(f"Не удалось сгенерировать пост для новости {custom_id}: {result}")
+
+    # Новости с постом закроет bulk_create_posts, остальные возвращаются в очередь как неудачная попытка
+    answered = [row["news_item_id"] for row in rows]
+    db.query(NewsItem).filter(NewsItem.generation_batch_id == batch.id, NewsItem.id.in_(answered)).update(
+        {"generation_batch_id": None, "generation_claimed_at": None}, synchronize_session=False
+    )
+    db.query(NewsItem).filter(NewsItem.generation_batch_id == batch.id).update(
+        crud.requeue_values(), synchronize_session=False
+    )
+    batch.completed_at = datetime.now()
+    # Посты, освобождение новостей и статус батча коммитятся вместе
+    crud.bulk_create_posts(db, rows)
+    return len(rows)
 
 
 @celery_app.task
 def publish_posts_to_telegram():
-    """Публикует все посты со статусом 'draft' в Telegram-канал"""
+    """
+    Публикует черновики в Telegram-канал.
+    Посты забираются через статус 'publishing', поэтому задачу можно запускать
+    на нескольких воркерах одновременно без повторной отправки.
+    """
     db = SessionLocal()
+    published = failed = timed_out = 0
     try:
-        posts = db.query(Post).filter(Post.status == "draft").limit(settings.MAX_POSTS_PER_PUBLISH).all()
+        crud.fail_stale_publishing_posts(db, settings.PUBLISH_CLAIM_TIMEOUT)
+        posts = crud.claim_posts_for_publishing(db, settings.MAX_POSTS_PER_PUBLISH)
 
         if not posts:
             logger.info("Нет постов для публикации")
-            return {"published": 0}
+            return {"published": 0, "failed": 0, "timed_out": 0}
 
-        # Публикуем каждый пост в отдельном asyncio.run()
+        # Все посты уходят через одно постоянное подключение воркера
+        publisher = get_publisher()
         for post in posts:
+            started = time.perf_counter()
             try:
-                # Создаём НОВЫЙ клиент для каждой публикации
-                asyncio.run(publish_single_post(post.title, post.content))
-
-                post.status = "published"
-                db.commit()
-                logger.info(f"✅ Опубликован пост: {post.title[:50]}...")
-
+                publisher.send_message(f"{post.title}\n\n{post.content}")
+            except PublishTimeoutError as e:
+                # Сообщение могло уйти: пост остаётся в 'publishing', и по PUBLISH_CLAIM_TIMEOUT
+                # fail_stale_publishing_posts переведёт его в failed для ручной проверки
+                PUBLISH_SECONDS.labels("error").observe(time.perf_counter() - started)
+                PUBLISH_FAILURES.labels(type(e).__name__).inc()
+                logger.error(f"❌ Публикация поста {post.id} не подтверждена: {e}")
+                timed_out += 1
+                continue
             except Exception as e:
+                PUBLISH_SECONDS.labels("error").observe(time.perf_counter() - started)
+                PUBLISH_FAILURES.labels(type(e).__name__).inc()
                 logger.error(f"❌ Ошибка публикации поста {post.id}: {e}")
-                post.status = "failed"
-                db.commit()
+                crud.finish_post_publishing(db, post.id, "failed")
+                failed += 1
+                continue
+            PUBLISH_SECONDS.labels("ok").observe(time.perf_counter() - started)
+
+            if crud.finish_post_publishing(db, post.id, "published"):
+                logger.info(f"✅ Опубликован пост: {post.title[:50]}...")
+            else:
+                logger.warning(f"Пост {post.id} отправлен, но уже снят с публикации по таймауту")
+            published += 1
 
     finally:
         db.close()
 
-    return {"published": len(posts)}
+    return {"published": published, "failed": failed, "timed_out": timed_out}
 
 
-async def publish_single_post(title: str, content: str):
-    """Публикует один пост"""
-    client = TelegramClient(
-        settings.TELEGRAM_SESSION_NAME,
-        settings.TELEGRAM_API_ID,
-        settings.TELEGRAM_API_HASH
-    )
-
-    await client.connect()
+@celery_app.task
+def rebuild_stat_counters():
+    """Сверяет счётчики дашборда с таблицами"""
+    db = SessionLocal()
     try:
-        message = f"{title}\n\n{content}"
-        await client.send_message(
-            entity=settings.TELEGRAM_CHANNEL_USERNAME,
-            message=message
-        )
-        logger.info(f"📤 Пост опубликован в канал {settings.TELEGRAM_CHANNEL_USERNAME}")
+        return crud.rebuild_stat_counters(db)
     finally:
-        await client.disconnect()
+        db.close()
@@ -1,15 +1,20 @@
+import argparse
 import asyncio
 from telethon import TelegramClient
 from telethon.errors import SessionPasswordNeededError
 from app.config import settings
 
 
-async def initialize_telegram_session():
-    """Интерактивная инициализация сессии Telethon"""
-    print("🚀 Инициализация Telegram-сессии...")
+async def initialize_telegram_session(session_name: str = settings.TELEGRAM_SESSION_NAME):
+    """
+    Интерактивная инициализация сессии Telethon.
+    У слушателя каналов и издателя свои сессии со своими ключами авторизации,
+    их авторизуют отдельно (--listener, --publisher)
+    """
+    print(f"🚀 Инициализация Telegram-сессии {session_name}...")
 
     client = TelegramClient(
-        settings.TELEGRAM_SESSION_NAME,
+        session_name,
         settings.TELEGRAM_API_ID,
         settings.TELEGRAM_API_HASH
     )
@@ -67,7 +72,7 @@ async def initialize_telegram_session():
     await client.disconnect()  # type: ignore
     # Проверим, что файл сессии создан
     import os
-    session_file = f"{settings.TELEGRAM_SESSION_NAME}.session"
+    session_file = f"{session_name}.session"
     if os.path.exists(session_file):
         print(f"📁 Файл сессии сохранён: {session_file}")
     else:
@@ -77,4 +82,17 @@ async def initialize_telegram_session():
 
 
 if __name__ == "__main__":
-    asyncio.run(initialize_telegram_session())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Авторизация Telegram-сессии")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--listener", action="store_true",
+                       help="авторизовать сессию слушателя каналов (TELEGRAM_LISTENER_SESSION_NAME)")
+    group.add_argument("--publisher", action="store_true",
+                       help="авторизовать сессию издателя (TELEGRAM_PUBLISHER_SESSION_NAME)")
+    args = parser.parse_args()
+    if args.listener:
+        session = settings.TELEGRAM_LISTENER_SESSION_NAME
+    elif args.publisher:
+        session = settings.TELEGRAM_PUBLISHER_SESSION_NAME
+    else:
+        session = settings.TELEGRAM_SESSION_NAME
+    asyncio.run(initialize_telegram_session(session))
\ No newline at end of file
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import os
+import threading
+from typing import Optional
+
+from telethon import TelegramClient
+from telethon.errors import FloodWaitError
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PublishTimeoutError(TimeoutError):
+    """Отправка не завершилась за TELEGRAM_SEND_TIMEOUT: сообщение могло уйти в канал, а могло и нет"""
+
+
+class TelegramPublisher:
+    """
+    Долгоживущее подключение к Telegram для публикации постов.
+    Клиент работает в собственном event loop в фоновом потоке: пока процесс жив,
+    Telethon сам шлёт keepalive-пинги, а сторожевая корутина переподключает
+    клиент, если соединение всё-таки упало. Одно подключение на процесс-воркер
+    переиспользуется между постами и вызовами задач.
+    Сессия своя (TELEGRAM_PUBLISHER_SESSION_NAME), а публикация идёт из одного процесса
+    (очередь PUBLISH_QUEUE), поэтому файл сессии больше никто не открывает.
+    """
+
+    def __init__(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="telegram-publisher", daemon=True)
+        self._thread.start()
+        self._client: Optional[TelegramClient] = None
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._watchdog = None
+
+    def _call(self, coro, timeout: float = None):
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            # Иначе корутина продолжит работать в фоновом loop и может отправить сообщение позже
+            future.cancel()
+            raise
+
+    async def _ensure_connected(self) -> TelegramClient:
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._client is None:
+                # Клиент создаётся внутри loop фонового потока, к которому он и привязан
+                self._client = TelegramClient(
+                    settings.TELEGRAM_PUBLISHER_SESSION_NAME,
+                    settings.TELEGRAM_API_ID,
+                    settings.TELEGRAM_API_HASH
+                )
+            if not self._client.is_connected():
+                await self._client.connect()
+                if not await self._client.is_user_authorized():
+                    await self._client.disconnect()
+                    raise RuntimeError("Telegram session not authorized. Please run auth script.")
+                logger.info("Telegram publisher connected")
+            if self._watchdog is None:
+                self._watchdog = asyncio.ensure_future(self._keep_connected())
+        return self._client
+
+    async def _keep_connected(self):
+        while True:
+            await asyncio.sleep(settings.TELEGRAM_KEEPALIVE_INTERVAL)
+            if self._client is not None and not self._client.is_connected():
+                try:
+                    await self._ensure_connected()
+                    logger.info("Telegram publisher reconnected")
+                except Exception as e:
+                    logger.warning(f"Telegram publisher reconnect failed: {e}")
+
+    async def _send(self, message: str):
+        client = await self._ensure_connected()
+        try:
+            await client.send_message(entity=settings.TELEGRAM_CHANNEL_USERNAME, message=message)
+        except FloodWaitError as e:
+            if e.seconds > settings.TELEGRAM_MAX_FLOOD_WAIT:
+                raise
+            logger.warning(f"FloodWait {e.seconds}s при публикации, ждём")
+            await asyncio.sleep(e.seconds)
+            await client.send_message(entity=settings.TELEGRAM_CHANNEL_USERNAME, message=message)
+        except ConnectionError:
+            # Соединение порвалось между пингами — переподключаемся и повторяем один раз
+            await client.disconnect()
+            client = await self._ensure_connected()
+            await client.send_message(entity=settings.TELEGRAM_CHANNEL_USERNAME, message=message)
+        finally:
+            # Telethon пишет сущности из ответа в SQLite-сессию без коммита до следующего save()
+            # (keepalive, ~60 с) — коммитим сразу, чтобы не держать блокировку записи между постами
+            client.session.save()
+
+    def send_message(self, message: str):
+        """
+        Отправляет сообщение в канал, блокируя вызывающий поток до результата.
+        По таймауту отправка отменяется и бросается PublishTimeoutError: запрос мог
+        уже дойти до Telegram, поэтому считать сообщение неотправленным нельзя.
+        """
+        try:
+            self._call(self._send(message), timeout=settings.TELEGRAM_SEND_TIMEOUT)
+        except TimeoutError as e:
+            raise PublishTimeoutError(
+                f"Telegram send did not finish in {settings.TELEGRAM_SEND_TIMEOUT}s"
+            ) from e
+        logger.info(f"📤 Пост опубликован в канал {settings.TELEGRAM_CHANNEL_USERNAME}")
+
+    def close(self):
+        async def shutdown():
+            if self._watchdog:
+                self._watchdog.cancel()
+            if self._client is not None:
+                await self._client.disconnect()
+
+        try:
+            self._call(shutdown(), timeout=10)
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=10)
+
+
+_publisher: Optional[TelegramPublisher] = None
+_publisher_pid: Optional[int] = None
+_publisher_lock = threading.Lock()
+
+
+def get_publisher() -> TelegramPublisher:
+    """Издатель текущего процесса; после fork создаётся заново"""
+    global _publisher, _publisher_pid
+    with _publisher_lock:
+        if _publisher is None or _publisher_pid != os.getpid():
+            _publisher = TelegramPublisher()
+            _publisher_pid = os.getpid()
+        return _publisher
+
+
+def close_publisher():
+    global _publisher
+    with _publisher_lock:
+        if _publisher is not None and _publisher_pid == os.getpid():
+            _publisher.close()
+        _publisher = None
@@ -1,4 +1,9 @@
+import os
+import time
 from celery import Celery
+from celery.signals import (
+    task_postrun, task_prerun, worker_init, worker_process_init, worker_process_shutdown
+)
 from app.config import settings
 from app.logging_config import setup_logging
 
@@ -12,7 +17,14 @@ celery_app = Celery(
 
 # Автоматически обнаруживать задачи в app.tasks
 celery_app.autodiscover_tasks(["app"])
-# Периодические задачи
+# Публикация идёт из отдельного воркера с одним процессом (-Q publishing -c 1):
+# постоянное подключение к Telegram и его файл сессии должны быть единственными
+PUBLISH_QUEUE = "publishing"
+celery_app.conf.task_routes = {
+    "app.tasks.publish_posts_to_telegram": {"queue": PUBLISH_QUEUE},
+}
+# Периодические задачи. При PIPELINE_CHAINING сбор сам ставит генерацию, а генерация — публикацию,
+# так что генерация и публикация по расписанию лишь подбирают пропущенное
 celery_app.conf.beat_schedule = {
     "fetch-news-sites": {
         "task": "app.tasks.fetch_news_from_sites",
@@ -24,10 +36,76 @@ celery_app.conf.beat_schedule = {
     },
     "generate-posts": {
         "task": "app.tasks.generate_posts_for_unprocessed_news",
-        "schedule": 35 * 60,  # после сбора новостей
+        "schedule": 35 * 60,  # страховка: пропущенные и возвращённые в очередь новости
     },
     "publish-posts": {
         "task": "app.tasks.publish_posts_to_telegram",
-        "schedule": 40 * 60,  # после генерации
+        "schedule": 40 * 60,  # страховка: черновики, не опубликованные цепочкой
+    },
+    "rebuild-stat-counters": {
+        "task": "app.tasks.rebuild_stat_counters",
+        "schedule": 24 * 60 * 60,  # страховка от расхождения счётчиков
     },
 }
+
+
+@worker_process_init.connect
+def init_db_engines(**kwargs):
+    # Дочерний процесс prefork не должен пользоваться соединениями, унаследованными от родителя
+    from app.database import init_engines
+    init_engines()
+
+
+@worker_process_shutdown.connect
+def dispose_db_engines(**kwargs):
+    from app.database import dispose_engines
+    dispose_engines()
+
+
+@worker_process_shutdown.connect
+def close_telegram_publisher(**kwargs):
+    # Корректно закрываем постоянное подключение к Telegram при остановке процесса
+    from app.telegram.publisher import close_publisher
+    close_publisher()
+
+
+@worker_init.connect
+def start_metrics_exporter(**kwargs):
+    # Главный процесс воркера: чистим метрики прошлого запуска и отдаём метрики всех дочерних процессов
+    if not settings.METRICS_WORKER_PORT:
+        return
+    from app import metrics
+    metrics.reset_multiprocess_dir()
+    metrics.start_worker_exporter(settings.METRICS_WORKER_PORT)
+
+
+@worker_process_shutdown.connect
+def mark_metrics_process_dead(**kwargs):
+    from app.metrics import mark_process_dead
+    mark_process_dead(os.getpid())
+
+
+# Время старта и профилировщик выполняющихся задач этого процесса по task_id
+_task_started = {}
+_task_profilers = {}
+
+
+@task_prerun.connect
+def remember_task_start(task_id=None, **kwargs):
+    from app.profiling import start_profiler
+    _task_started[task_id] = time.perf_counter()
+    profiler = start_profiler()
+    if profiler:
+        _task_profilers[task_id] = profiler
+
+
+@task_postrun.connect
+def observe_task_duration(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is None:
+        return
+    duration = time.perf_counter() - started
+    from app.metrics import CELERY_TASK_SECONDS
+    from app.profiling import stop_profiler
+    CELERY_TASK_SECONDS.labels(task.name, state or "UNKNOWN").observe(duration)
+    stop_profiler(_task_profilers.pop(task_id, None), "task", task.name, duration)
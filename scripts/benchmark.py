@@ -0,0 +1,400 @@
+"""
+Сквозной бенчмарк конвейера на локальных заглушках:
+fetch_news_from_sites -> generate_posts_for_unprocessed_news -> publish_posts_to_telegram.
+
+- RSS: синтетические ленты заданного размера с локальных HTTP-серверов (по серверу на «хост»);
+- OpenAI: scripts/fake_openai.py с настраиваемой задержкой;
+- Telegram: заглушка-приёмник вместо постоянного подключения;
+- Postgres: отдельная база из --database-url. ВСЕ ТАБЛИЦЫ ЭТОЙ БАЗЫ ОЧИЩАЮТСЯ.
+
+Отчёт: элементов в секунду по этапам и сквозной, p50/p99 задержки элемента на каждом этапе,
+число обращений к БД на элемент. Результат дописывается строкой JSON в --output
+и сравнивается с прошлым запуском с теми же параметрами.
+
+Запуск:
+    uv run python scripts/benchmark.py --database-url postgresql+psycopg://localhost/aibot_bench
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Параметры запуска, по которым сравниваются результаты разных прогонов
+COMPARABLE_PARAMS = (
+    "feeds", "items", "hosts", "feed_latency", "llm_latency", "telegram_latency", "items_per_request"
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Бенчмарк конвейера сбор → генерация → публикация")
+    parser.add_argument("--database-url", required=True, help="отдельная база Postgres, будет очищена")
+    parser.add_argument("--feeds", type=int, default=20, help="число RSS-лент")
+    parser.add_argument("--items", type=int, default=50, help="новостей в каждой ленте")
+    parser.add_argument("--hosts", type=int, default=4, help="число HTTP-серверов, между которыми делятся ленты")
+    parser.add_argument("--feed-latency", type=float, default=0.05, help="задержка ответа ленты, с")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="задержка ответа заглушки OpenAI, с")
+    parser.add_argument("--telegram-latency", type=float, default=0.02, help="задержка отправки в Telegram, с")
+    parser.add_argument("--output", default=os.path.join(ROOT, "benchmarks", "results.jsonl"))
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+def configure_environment(args):
+    """Настройки приложения читаются при импорте, поэтому окружение задаётся до импорта app"""
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ["FAKE_OPENAI_LATENCY"] = str(args.llm_latency)
+    os.environ["OPENAI_API_KEY"] = "benchmark"
+    os.environ["LLM_CACHE_BACKEND"] = "none"
+    os.environ["GENERATION_MODE"] = "realtime"
+    os.environ["PROFILING_ENABLED"] = "false"
+    # Этапы запускаются по очереди прямо в процессе, без брокера Celery
+    os.environ["PIPELINE_CHAINING"] = "false"
+    # Лимиты OpenAI в бенчмарке не нужны, но их можно переопределить окружением
+    os.environ.setdefault("LLM_REQUESTS_PER_MINUTE", "1000000")
+    os.environ.setdefault("LLM_TOKENS_PER_MINUTE", "1000000000")
+    os.environ.setdefault("MAX_POSTS_PER_PUBLISH", "100")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# --- Синтетические RSS-ленты ---
+
+def build_feed(feed_index: int, items: int, run_id: str, rng: random.Random, vocabulary: list) -> bytes:
+    now = datetime.now(timezone.utc)
+    entries = []
+    for i in range(items):
+        # Случайные слова из большого словаря: новости не склеиваются как почти-дубли
+        words = " ".join(rng.choice(vocabulary) for _ in range(40))
+        title = f"Новость {run_id}-{feed_index}-{i}: {' '.join(words.split()[:6])}"
+        entries.append(
+            "<item>"
+            f"<title>{escape(title)}</title>"
+            f"<link>http://bench.local/{run_id}/{feed_index}/{i}</link>"
+            f"<description>{escape('<p>' + words + '</p>')}</description>"
+            f"<pubDate>{format_datetime(now - timedelta(minutes=i))}</pubDate>"
+            "</item>"
+        )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel>'
+        f"<title>Bench {feed_index}</title>{''.join(entries)}</channel></rss>"
+    ).encode()
+
+
+def start_feed_servers(feeds: dict, hosts: int, latency: float) -> list:
+    """Поднимает hosts серверов; ленты раскладываются по ним по кругу. Возвращает URL лент"""
+
+    class FeedHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = feeds.get(self.path)
+            if latency:
+                time.sleep(latency)
+            if body is None:
+                self.send_response(404)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/rss+xml")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    ports = []
+    for _ in range(max(1, hosts)):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), FeedHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        ports.append(server.server_address[1])
+    return [f"http://127.0.0.1:{ports[i % len(ports)]}{path}" for i, path in enumerate(feeds)]
+
+
+def start_fake_openai() -> str:
+    import uvicorn
+    from scripts import fake_openai
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(fake_openai.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}/v1"
+
+
+class FakeTelegramSink:
+    """Заглушка TelegramPublisher: ждёт заданную задержку и запоминает сообщения"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.sent = 0
+        self.last_started = 0.0
+
+    def send_message(self, text: str):
+        self.last_started = time.perf_counter()
+        if self.latency:
+            time.sleep(self.latency)
+        self.sent += 1
+
+
+# --- Замеры ---
+
+class StageRecorder:
+    """Задержки элементов и число SQL-запросов на текущем этапе"""
+
+    def __init__(self):
+        self.latencies = []
+        self.queries = 0
+
+    def reset(self):
+        self.latencies = []
+        self.queries = 0
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def instrument(recorder: StageRecorder):
+    """Подключает замеры к движку БД, загрузке лент, генерации и публикации"""
+    from sqlalchemy import event
+    import app.ai.generator as generator
+    import app.tasks as tasks
+    from app.api import crud
+    from app.database import engine
+    from app.news_parser.sites import NewsParser
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_query(*args, **kwargs):
+        recorder.queries += 1
+
+    fetch_feed = NewsParser._fetch_feed.__func__
+
+    def timed_fetch_feed(cls, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fetch_feed(cls, *args, **kwargs)
+        finally:
+            recorder.latencies.append(time.perf_counter() - started)
+
+    NewsParser._fetch_feed = classmethod(timed_fetch_feed)
+
+    generate_post = generator.generate_post_from_news
+    generate_group = generator.generate_posts_for_news_group
+
+    async def timed_generate_post(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await generate_post(*args, **kwargs)
+        finally:
+            recorder.latencies.append(time.perf_counter() - started)
+
+    async def timed_generate_group(summaries, *args, **kwargs):
+        # Все новости группы готовы одновременно — у каждой задержка всего запроса
+        started = time.perf_counter()
+        try:
+            return await generate_group(summaries, *args, **kwargs)
+        finally:
+            recorder.latencies.extend([time.perf_counter() - started] * len(summaries))
+
+    generator.generate_post_from_news = timed_generate_post
+    generator.generate_posts_for_news_group = timed_generate_group
+
+    # Публикация поста: от начала отправки до фиксации статуса в БД
+    sink = FakeTelegramSink(0)
+    finish_publishing = crud.finish_post_publishing
+
+    def timed_finish(db, post_id, status):
+        try:
+            return finish_publishing(db, post_id, status)
+        finally:
+            recorder.latencies.append(time.perf_counter() - sink.last_started)
+
+    crud.finish_post_publishing = timed_finish
+    tasks.get_publisher = lambda: sink
+    return sink
+
+
+def reset_database(feed_urls: list):
+    from sqlalchemy import text
+    from app.api import crud
+    from app.api.schemas import NewsSourceCreate
+    from app.database import SessionLocal, engine
+    from app.models import Base
+
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "TRUNCATE posts, news_items, generation_batches, news_sources, stat_counters RESTART IDENTITY CASCADE"
+        ))
+    db = SessionLocal()
+    try:
+        for i, url in enumerate(feed_urls):
+            crud.create_news_source(db, NewsSourceCreate(name=f"bench-{i}", url=url, parser_type="rss"))
+        crud.rebuild_stat_counters(db)
+    finally:
+        db.close()
+
+
+def llm_totals() -> tuple:
+    """Число запросов к LLM и prompt-токенов по метрикам приложения"""
+    from prometheus_client import REGISTRY
+    requests = sum(
+        REGISTRY.get_sample_value("aibot_llm_request_seconds_count", {"outcome": outcome}) or 0
+        for outcome in ("ok", "error")
+    )
+    return requests, REGISTRY.get_sample_value("aibot_llm_tokens_total", {"kind": "prompt"}) or 0
+
+
+def run_stage(name: str, recorder: StageRecorder, run, count_items) -> dict:
+    recorder.reset()
+    llm_before = llm_totals()
+    started = time.perf_counter()
+    items = count_items(run())
+    elapsed = time.perf_counter() - started
+    llm_requests, prompt_tokens = (after - before for after, before in zip(llm_totals(), llm_before))
+    return {
+        "stage": name,
+        "items": items,
+        "seconds": round(elapsed, 3),
+        "items_per_sec": round(items / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(recorder.latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(recorder.latencies, 99) * 1000, 2),
+        "db_round_trips": recorder.queries,
+        "db_round_trips_per_item": round(recorder.queries / items, 2) if items else 0.0,
+        "llm_requests_per_item": round(llm_requests / items, 3) if items else 0.0,
+        "prompt_tokens_per_item": round(prompt_tokens / items, 1) if items else 0.0,
+    }
+
+
+def run_until_empty(task, key: str):
+    """Запускает задачу, пока она находит работу; возвращает суммарное значение key"""
+    total = 0
+    while True:
+        result = task()
+        if not result.get(key):
+            return total
+        total += result[key]
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def previous_result(path: str, params: dict):
+    try:
+        with open(path, encoding="utf-8") as f:
+            runs = [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return None
+    matching = [run for run in runs if all(run["params"].get(k) == params[k] for k in COMPARABLE_PARAMS)]
+    return matching[-1] if matching else None
+
+
+def print_report(result: dict, previous):
+    previous_stages = {stage["stage"]: stage for stage in previous["stages"]} if previous else {}
+    print(f"\nБенчмарк {result['timestamp']} ({result['git']}), параметры: {result['params']}")
+    print(
+        f"{'этап':<10}{'элементов':>10}{'сек':>9}{'эл/с':>10}{'p50 мс':>10}{'p99 мс':>10}{'БД/эл':>8}"
+        f"{'LLM/эл':>8}{'ток/эл':>8}{'Δ эл/с':>10}"
+    )
+    for stage in result["stages"] + [result["total"]]:
+        before = previous_stages.get(stage["stage"]) or (previous["total"] if previous and stage is result["total"] else None)
+        delta = ""
+        if before and before["items_per_sec"]:
+            delta = f"{(stage['items_per_sec'] / before['items_per_sec'] - 1) * 100:+.1f}%"
+        print(
+            f"{stage['stage']:<10}{stage['items']:>10}{stage['seconds']:>9}{stage['items_per_sec']:>10}"
+            f"{stage.get('p50_ms', ''):>10}{stage.get('p99_ms', ''):>10}"
+            f"{stage.get('db_round_trips_per_item', ''):>8}{stage.get('llm_requests_per_item', ''):>8}"
+            f"{stage.get('prompt_tokens_per_item', ''):>8}{delta:>10}"
+        )
+    if previous:
+        print(f"Δ — относительно запуска {previous['timestamp']} ({previous['git']})")
+
+
+def main():
+    args = parse_args()
+    configure_environment(args)
+
+    rng = random.Random(args.seed)
+    vocabulary = ["".join(rng.choice("абвгдеклмнопрстуя") for _ in range(rng.randint(4, 9))) for _ in range(5000)]
+    run_id = datetime.now().strftime("%Y%m%d%H%M%S")
+    feeds = {
+        f"/feed/{i}.xml": build_feed(i, args.items, run_id, rng, vocabulary)
+        for i in range(args.feeds)
+    }
+    feed_urls = start_feed_servers(feeds, args.hosts, args.feed_latency)
+    os.environ["OPENAI_BASE_URL"] = start_fake_openai()
+
+    import logging
+    import app.tasks as tasks
+    logging.getLogger().setLevel(logging.WARNING)
+
+    recorder = StageRecorder()
+    sink = instrument(recorder)
+    sink.latency = args.telegram_latency
+    reset_database(feed_urls)
+
+    stages = [
+        run_stage("fetch", recorder, tasks.fetch_news_from_sites, lambda r: r["inserted"]),
+        run_stage("generate", recorder, lambda: run_until_empty(tasks.generate_posts_for_unprocessed_news, "created"),
+                  lambda created: created),
+        run_stage("publish", recorder, lambda: run_until_empty(tasks.publish_posts_to_telegram, "published"),
+                  lambda published: published),
+    ]
+    total_seconds = sum(stage["seconds"] for stage in stages)
+    total_items = stages[-1]["items"]
+    total_queries = sum(stage["db_round_trips"] for stage in stages)
+    result = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git": git_revision(),
+        "params": {
+            "feeds": args.feeds, "items": args.items, "hosts": args.hosts, "feed_latency": args.feed_latency,
+            "llm_latency": args.llm_latency, "telegram_latency": args.telegram_latency,
+            "llm_concurrency": int(os.environ.get("LLM_CONCURRENCY", "8")),
+            "items_per_request": int(os.environ.get("GENERATION_ITEMS_PER_REQUEST", "5")),
+        },
+        "stages": stages,
+        "total": {
+            "stage": "total",
+            "items": total_items,
+            "seconds": round(total_seconds, 3),
+            "items_per_sec": round(total_items / total_seconds, 2) if total_seconds else 0.0,
+            "db_round_trips_per_item": round(total_queries / total_items, 2) if total_items else 0.0,
+        },
+    }
+
+    previous = previous_result(args.output, result["params"])
+    print_report(result, previous)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "a", encoding="utf-8") as f:
+        f.write(json.dumps(result, ensure_ascii=False) + "\n")
+    print(f"Результат добавлен в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
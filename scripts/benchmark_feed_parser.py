@@ -0,0 +1,88 @@
+"""
+Сравнение быстрого разбора лент (app.news_parser.fastfeed) с feedparser на фикстурах
+из benchmarks/fixtures/feeds: время разбора и совпадение результата.
+
+Заголовок, ссылка и дата должны совпадать точно. Описание сравнивается по тексту:
+feedparser дополнительно чистит HTML (убирает script, style и т.п.), быстрый разбор отдаёт его как есть.
+
+Запуск:
+    uv run python scripts/benchmark_feed_parser.py [--repeat 20] [файлы лент...]
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.news_parser.fastfeed import FastFeedError, parse_feed_fast  # noqa: E402
+from app.news_parser.sites import NewsParser  # noqa: E402
+
+FIXTURES = os.path.join(ROOT, "benchmarks", "fixtures", "feeds")
+
+
+def best_time(func, content: bytes, repeat: int) -> float:
+    """Лучшее время одного разбора из repeat попыток, в секундах"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(content)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def text_of(html: str) -> str:
+    return " ".join(BeautifulSoup(html, "html.parser").get_text(" ").split())
+
+
+def mismatches(fast: list, slow: list) -> list:
+    if len(fast) != len(slow):
+        return [f"{len(fast)} записей против {len(slow)}"]
+    problems = []
+    for index, (a, b) in enumerate(zip(fast, slow)):
+        for field in ("title", "url", "published_at"):
+            if a[field] != b[field]:
+                problems.append(f"#{index} {field}: {a[field]!r} != {b[field]!r}")
+        if text_of(a["summary"]) != text_of(b["summary"]):
+            problems.append(f"#{index} summary: текст отличается")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Быстрый разбор лент против feedparser")
+    parser.add_argument("files", nargs="*", help="файлы лент (по умолчанию все фикстуры)")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    files = args.files or sorted(glob.glob(os.path.join(FIXTURES, "*")))
+
+    print(f"{'лента':<24}{'КБ':>7}{'записей':>9}{'feedparser мс':>15}{'быстрый мс':>12}{'ускорение':>11}  результат")
+    total_slow = total_fast = 0.0
+    for path in files:
+        with open(path, "rb") as f:
+            content = f.read()
+        slow = NewsParser._parse_with_feedparser(content)
+        slow_time = best_time(NewsParser._parse_with_feedparser, content, args.repeat)
+        try:
+            fast = parse_feed_fast(content)
+        except FastFeedError as e:
+            status, fast_time = f"откат на feedparser ({e})", slow_time
+        else:
+            fast_time = best_time(parse_feed_fast, content, args.repeat)
+            problems = mismatches(fast, slow)
+            status = "совпадает" if not problems else "РАСХОЖДЕНИЯ: " + "; ".join(problems[:3])
+        total_slow += slow_time
+        total_fast += fast_time
+        print(
+            f"{os.path.basename(path):<24}{len(content) / 1024:>7.0f}{len(slow):>9}"
+            f"{slow_time * 1000:>15.2f}{fast_time * 1000:>12.2f}{slow_time / fast_time:>10.1f}x  {status}"
+        )
+    if total_fast:
+        print(f"{'итого':<40}{total_slow * 1000:>15.2f}{total_fast * 1000:>12.2f}{total_slow / total_fast:>10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Локальная заглушка OpenAI API для разработки и проверки генерации без затрат.
+Поддерживает chat completions, загрузку файлов и Batch API.
+
+Запуск:
+    uvicorn scripts.fake_openai:app --port 8001
+    OPENAI_BASE_URL=http://localhost:8001/v1
+
+FAKE_OPENAI_LATENCY — задержка ответа chat completions в секундах,
+FAKE_OPENAI_BATCH_DELAY — через сколько секунд после создания батч считается выполненным,
+FAKE_OPENAI_DROP_RATE — доля постов, пропущенных в JSON-ответе на несколько новостей (для проверки повторов).
+"""
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi.responses import Response
+
+LATENCY = float(os.getenv("FAKE_OPENAI_LATENCY", "0"))
+BATCH_DELAY = float(os.getenv("FAKE_OPENAI_BATCH_DELAY", "0"))
+DROP_RATE = float(os.getenv("FAKE_OPENAI_DROP_RATE", "0"))
+
+app = FastAPI(title="Fake OpenAI API")
+
+files: dict = {}
+batches: dict = {}
+
+
+def _post_text(news: str) -> tuple:
+    return f"🚀 {news[:60].strip()}", f"{news[:400].strip()} #новости"
+
+
+def _completion(body: dict) -> dict:
+    news = body["messages"][-1]["content"]
+    if (body.get("response_format") or {}).get("type") == "json_schema":
+        # Несколько новостей: JSON-массив {news_id, text} на входе, {"posts": [...]} на выходе
+        posts = [
+            dict(zip(("title", "content"), _post_text(item["text"])), news_id=item["news_id"])
+            for item in json.loads(news)
+            if random.random() >= DROP_RATE
+        ]
+        text = json.dumps({"posts": posts}, ensure_ascii=False)
+    else:
+        text = "\n\n".join(_post_text(news))
+    prompt_tokens = sum(len(m["content"]) // 3 + 1 for m in body["messages"])
+    completion_tokens = len(text) // 3 + 1
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": text},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def _file_object(file_id: str) -> dict:
+    f = files[file_id]
+    return {
+        "id": file_id,
+        "object": "file",
+        "bytes": len(f["content"]),
+        "created_at": f["created_at"],
+        "filename": f["filename"],
+        "purpose": f["purpose"],
+        "status": "processed",
+    }
+
+
+def _store_file(content: bytes, filename: str, purpose: str) -> str:
+    file_id = f"file-{uuid.uuid4().hex}"
+    files[file_id] = {"content": content, "filename": filename, "purpose": purpose, "created_at": int(time.time())}
+    return file_id
+
+
+def _run_batch(batch: dict):
+    """Выполняет все запросы батча и складывает ответы в выходной файл"""
+    output = []
+    for line in files[batch["input_file_id"]]["content"].decode("utf-8").splitlines():
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        output.append(json.dumps({
+            "id": f"batch_req_{uuid.uuid4().hex}",
+            "custom_id": request["custom_id"],
+            "response": {"status_code": 200, "request_id": uuid.uuid4().hex, "body": _completion(request["body"])},
+            "error": None,
+        }, ensure_ascii=False))
+    batch["output_file_id"] = _store_file("\n".join(output).encode("utf-8"), "batch_output.jsonl", "batch_output")
+    batch["status"] = "completed"
+    batch["completed_at"] = int(time.time())
+    batch["request_counts"] = {"total": len(output), "completed": len(output), "failed": 0}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    if LATENCY:
+        await asyncio.sleep(LATENCY)
+    return _completion(body)
+
+
+@app.post("/v1/files")
+async def upload_file(file: UploadFile = File(...), purpose: str = Form(...)):
+    file_id = _store_file(await file.read(), file.filename, purpose)
+    return _file_object(file_id)
+
+
+@app.get("/v1/files/{file_id}/content")
+def file_content(file_id: str):
+    if file_id not in files:
+        raise HTTPException(status_code=404, detail="No such file")
+    return Response(content=files[file_id]["content"], media_type="application/octet-stream")
+
+
+@app.post("/v1/batches")
+async def create_batch(request: Request):
+    body = await request.json()
+    if body["input_file_id"] not in files:
+        raise HTTPException(status_code=400, detail="No such file")
+    batch_id = f"batch_{uuid.uuid4().hex}"
+    batches[batch_id] = {
+        "id": batch_id,
+        "object": "batch",
+        "endpoint": body["endpoint"],
+        "input_file_id": body["input_file_id"],
+        "completion_window": body["completion_window"],
+        "status": "validating",
+        "created_at": int(time.time()),
+        "output_file_id": None,
+        "error_file_id": None,
+        "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        "metadata": body.get("metadata"),
+    }
+    return batches[batch_id]
+
+
+@app.get("/v1/batches/{batch_id}")
+def retrieve_batch(batch_id: str):
+    batch = batches.get(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="No such batch")
+    if batch["status"] != "completed":
+        if time.time() - batch["created_at"] >= BATCH_DELAY:
+            _run_batch(batch)
+        else:
+            batch["status"] = "in_progress"
+    return batch